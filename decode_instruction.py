@@ -4,9 +4,21 @@ RISC-V Instruction Decoder
 Decodes 32-bit instruction strings based on encoding.json
 """
 
+import functools
 import json
+import os
 import sys
 
+ENCODING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'encoding.json')
+
+
+@functools.lru_cache(maxsize=None)
+def load_encodings():
+    """Load encoding.json once (next to this script, independent of the working directory)"""
+    with open(ENCODING_PATH, 'r') as f:
+        return json.load(f)['instruction_encodings']
+
+
 def decode_instruction(inst_binary):
     """
     Decode a 32-bit binary instruction string
@@ -23,12 +35,8 @@ def decode_instruction(inst_binary):
     # Extract opcode (bits [6:0])
     opcode = inst_binary[-7:]
 
-    # Load encoding data
-    with open('encoding.json', 'r') as f:
-        data = json.load(f)
-
     # Find matching instruction
-    for inst in data['instruction_encodings']:
+    for inst in load_encodings():
         fields = inst['fields']
 
         # Check if opcode matches
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Static program analyzer
+Looks at a program without simulating it, to triage which of many workloads deserve a full simulation. Reads
+imem.txt (or any format of loader.py), splits it into basic blocks, builds the control-flow graph from the BEQ / BNE /
+JAL targets, computes def-use chains over the 32 registers and counts load-use hazards and branch sites. Register
+reads / writes, the load-use stall rule and branch directions follow the instruction classes of instructions.py.
+
+It also bounds the CPI of the five stage core. Every instruction takes one cycle, a load-use stall one more and a
+mispredicted BEQ / BNE / JAL one more (branches resolve in ID). The lower bound counts the stalls inside basic
+blocks and the flushes every execution must take. The upper bound counts every possible stall and flush plus the
+pipeline drain after HALT. A run is a mix of its basic blocks, so for loops the bounds are the cheapest / most
+expensive block; loop-free programs are bounded along their paths to HALT.
+
+    python analysis.py PROGRAM ... [--predictor not-taken] [--json] [--blocks]
+
+PROGRAM is an image file or a directory holding imem.txt (or imem.bin, .raw, .hex, .elf).
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sys
+
+from branch_predictor import PREDICTORS, StaticNotTaken
+from instructions import InstructionRBase, InstructionIBase, InstructionSBase, InstructionBBase, InstructionJBase, LW
+from loader import find_input, load_program
+from models import DecodedInstruction
+from predecode import decode_table
+
+ENTRY = -1  # definition standing for the value a register holds when the program starts
+DRAIN_CYCLES = 4  # cycles after HALT is fetched until it leaves WB
+STALL_CYCLES = 1  # bubble of a load-use stall
+FLUSH_CYCLES = 1  # fetch slot lost by a mispredicted branch / jump resolved in ID
+LOOP_WEIGHT = 10  # assumed iterations of every loop for the CPI estimate
+
+
+# instruction class bases of instructions.py -> format
+FORMATS = ((InstructionRBase, "R"), (InstructionIBase, "I"), (InstructionSBase, "S"), (InstructionBBase, "B"),
+           (InstructionJBase, "J"))
+FORMAT_OF = {}  # handler -> format, memoized (issubclass on the abc classes is slow)
+
+
+def format_of(instruction: DecodedInstruction):
+    # "R", "I", "S", "B" or "J" by the instruction class, None for HALT and words the cores cannot execute
+    handler = instruction.handler
+    if handler not in FORMAT_OF:
+        FORMAT_OF[handler] = next((form for base, form in FORMATS if handler and issubclass(handler, base)), None)
+    return FORMAT_OF[handler]
+
+
+def registers_of(instruction: DecodedInstruction) -> tuple:
+    # (registers read, register written or None) by the instruction class, x0 left out of both
+    form = format_of(instruction)
+    if form in ("R", "S", "B"):
+        reads = (instruction.rs1, instruction.rs2) if instruction.rs1 != instruction.rs2 else (instruction.rs1,)
+    elif form == "I":
+        reads = (instruction.rs1,)
+    else:
+        reads = ()
+    reads = tuple(register for register in reads if register != 0)
+    written = instruction.rd if form in ("R", "I", "J") and instruction.rd != 0 else None
+    return reads, written
+
+
+def load_use_stall(producer: DecodedInstruction, consumer: DecodedInstruction) -> bool:
+    # True if the five stage core stalls consumer in ID behind the LW producer in EX - the decode_fs conditions
+    # of instructions.py. BEQ / BNE / JAL read their operands through forwarding without stalling.
+    if producer.handler is not LW:
+        return False
+    form = format_of(consumer)
+    if form in ("R", "S"):
+        return producer.rd in (consumer.rs1, consumer.rs2) and consumer.rs1 != 0 and consumer.rs2 != 0
+    if form == "I":
+        return producer.rd == consumer.rs1 and consumer.rs1 != 0
+    return False
+
+
+def is_control(instruction: DecodedInstruction) -> bool:
+    return format_of(instruction) in ("B", "J")
+
+
+def branch_direction(instruction: DecodedInstruction):
+    # True / False when the BEQ / BNE compares a register with itself, None when it depends on register values
+    if instruction.rs1 != instruction.rs2:
+        return None
+    return instruction.handler.take_branch(None, 0, 0)
+
+
+def flush_range(instruction: DecodedInstruction, predictor: str) -> tuple:
+    # (fewest, most) flushes of one execution of the instruction with the named branch predictor
+    if not is_control(instruction):
+        return 0, 0
+    taken = True if format_of(instruction) == "J" else branch_direction(instruction)
+    if taken is False:
+        return 0, 0
+    if predictor == StaticNotTaken.name:
+        # every taken branch and every JAL flushes
+        return (FLUSH_CYCLES, FLUSH_CYCLES) if taken else (0, FLUSH_CYCLES)
+    # the other predictors only predict taken after a BTB hit - cold and aliased entries flush
+    return 0, FLUSH_CYCLES
+
+
+class BasicBlock(object):
+    def __init__(self, start: int, instructions: list):
+        self.start = start  # address of the first instruction
+        self.instructions = instructions  # DecodedInstruction records, the terminator (if any) last
+        self.successors = []  # start addresses of the blocks control continues at
+        self.predecessors = []
+        self.exits = 0  # successor addresses outside the program (the core fails fetching them)
+        self.load_use = 0  # load-use stalls between instructions of the block
+        self.entry_stall = False  # the first instruction stalls behind a LW ending the fall-through predecessor
+        self.flushes = (0, 0)  # (fewest, most) flushes of the terminator
+
+    @property
+    def end(self) -> int:
+        return self.start + 4 * len(self.instructions)
+
+    @property
+    def terminator(self) -> DecodedInstruction:
+        return self.instructions[-1]
+
+    @property
+    def halts(self) -> bool:
+        return self.terminator.is_halt
+
+    def cycles(self) -> tuple:
+        # (fewest, most) five stage cycles of one execution of the block, one per instruction plus penalties
+        fewest = len(self.instructions) + self.load_use * STALL_CYCLES + self.flushes[0]
+        return fewest, fewest + self.entry_stall * STALL_CYCLES + self.flushes[1] - self.flushes[0]
+
+
+class ProgramAnalysis(object):
+    # Basic blocks, control-flow graph, def-use chains and hazard counts of a decoded program (decode_table)
+
+    def __init__(self, table: list, predictor: str = StaticNotTaken.name):
+        self.table = table
+        self.predictor = predictor
+        self.blocks = {}  # start address -> BasicBlock
+        self.order = []  # start addresses of the blocks reachable from PC 0, in reverse postorder
+        self.back_edges = []  # (from block, to block) edges closing a loop
+        self.use_def = {}  # address -> {register read: frozenset of definition addresses, ENTRY the initial value}
+        self.def_use = {}  # address -> addresses reading the register it writes
+        self.inputs = set()  # registers read before the program writes them on some path
+        self.build_blocks()
+        self.link_blocks()
+        self.traverse()
+        self.reaching_definitions()
+
+    def target(self, pc: int, instruction: DecodedInstruction):
+        # address the branch / jump at pc continues at when taken, None outside the program
+        target = pc + instruction.imm
+        if 0 <= target < 4 * len(self.table) and target % 4 == 0:
+            return target
+        return None
+
+    def build_blocks(self):
+        # a block starts at PC 0, at every branch / jump target and after every branch, jump, HALT or word the
+        # cores cannot execute, and ends before the next start
+        leaders = {0} if self.table else set()
+        for index, instruction in enumerate(self.table):
+            if instruction.handler is None or is_control(instruction):
+                leaders.add(4 * index + 4)
+            if is_control(instruction):
+                target = self.target(4 * index, instruction)
+                if target is not None:
+                    leaders.add(target)
+        starts = sorted(leader for leader in leaders if leader < 4 * len(self.table))
+        for start, end in zip(starts, starts[1:] + [4 * len(self.table)]):
+            self.blocks[start] = BasicBlock(start, self.table[start >> 2: end >> 2])
+
+    def link_blocks(self):
+        for block in self.blocks.values():
+            terminator = block.terminator
+            pc = block.end - 4
+            form = format_of(terminator)
+            if form is None:
+                targets = []  # HALT, or a word the cores raise on
+            elif form == "J":
+                targets = [self.target(pc, terminator)]
+            elif form == "B":
+                taken = branch_direction(terminator)
+                targets = [self.target(pc, terminator)] if taken is not False else []
+                if taken is not True:
+                    targets.append(block.end if block.end in self.blocks else None)
+            else:
+                targets = [block.end if block.end in self.blocks else None]
+            for target in dict.fromkeys(targets):
+                if target is None:
+                    block.exits += 1
+                else:
+                    block.successors.append(target)
+                    self.blocks[target].predecessors.append(block.start)
+
+            block.load_use = sum(load_use_stall(producer, consumer)
+                                 for producer, consumer in zip(block.instructions, block.instructions[1:]))
+            block.flushes = flush_range(terminator, self.predictor)
+        for block in self.blocks.values():
+            # a block ending with a LW only continues at the next one
+            if block.end in self.blocks and block.end in block.successors:
+                successor = self.blocks[block.end]
+                successor.entry_stall |= load_use_stall(block.terminator, successor.instructions[0])
+
+    def traverse(self):
+        # depth first from PC 0: reverse postorder of the reachable blocks and the loop closing edges
+        if not self.blocks:
+            return
+        postorder = []
+        on_path = {0}
+        visited = {0}
+        stack = [(0, iter(self.blocks[0].successors))]
+        while stack:
+            start, successors = stack[-1]
+            for successor in successors:
+                if successor in on_path:
+                    self.back_edges.append((start, successor))
+                elif successor not in visited:
+                    visited.add(successor)
+                    on_path.add(successor)
+                    stack.append((successor, iter(self.blocks[successor].successors)))
+                    break
+            else:
+                stack.pop()
+                on_path.discard(start)
+                postorder.append(start)
+        self.order = postorder[::-1]
+
+    def reaching_definitions(self):
+        # iterative data flow over the reachable blocks, the state is one frozenset of definition addresses per
+        # register - sets are shared between blocks that do not write the register
+        if not self.order:
+            return
+        initial = frozenset((ENTRY,))
+        entry_state = (frozenset(),) + (initial,) * 31
+        last_writes = {}
+        for start in self.order:
+            block = self.blocks[start]
+            writes = last_writes[start] = {}
+            for offset, instruction in enumerate(block.instructions):
+                written = registers_of(instruction)[1]
+                if written is not None:
+                    writes[written] = frozenset((start + 4 * offset,))
+
+        state_in = {}
+        state_out = {}
+        changed = True
+        while changed:
+            changed = False
+            for start in self.order:
+                block = self.blocks[start]
+                incoming = [state_out[predecessor] for predecessor in block.predecessors if predecessor in state_out]
+                if start == 0:
+                    incoming.append(entry_state)
+                merged = merge_states(incoming)
+                if state_in.get(start) == merged:
+                    continue
+                state_in[start] = merged
+                state = list(merged)
+                for register, definitions in last_writes[start].items():
+                    state[register] = definitions
+                state_out[start] = tuple(state)
+                changed = True
+
+        for start in self.order:
+            state = list(state_in[start])
+            for offset, instruction in enumerate(self.blocks[start].instructions):
+                pc = start + 4 * offset
+                reads, written = registers_of(instruction)
+                if reads:
+                    self.use_def[pc] = {register: state[register] for register in reads}
+                for register in reads:
+                    for definition in state[register]:
+                        if definition == ENTRY:
+                            self.inputs.add(register)
+                        else:
+                            self.def_use.setdefault(definition, []).append(pc)
+                if written is not None:
+                    self.def_use.setdefault(pc, [])
+                    state[written] = frozenset((pc,))
+        for uses in self.def_use.values():
+            uses.sort()
+
+    def reachable_blocks(self) -> list:
+        return [self.blocks[start] for start in self.order]
+
+    def halting_paths(self):
+        # (fewest instructions, most instructions, fewest cycles, most cycles) over the paths from PC 0 to HALT of a
+        # loop-free program, None when no path halts
+        paths = {}
+        for start in reversed(self.order):
+            block = self.blocks[start]
+            fewest, most = block.cycles()
+            if block.halts:
+                paths[start] = (len(block.instructions), len(block.instructions), fewest, most)
+                continue
+            continued = [paths[successor] for successor in block.successors if paths.get(successor) is not None]
+            paths[start] = None
+            if continued:
+                paths[start] = (len(block.instructions) + min(path[0] for path in continued),
+                                len(block.instructions) + max(path[1] for path in continued),
+                                fewest + min(path[2] for path in continued),
+                                most + max(path[3] for path in continued))
+        return paths.get(0)
+
+    def shortest_run(self):
+        # fewest instructions executed from PC 0 up to and including a HALT, None if no HALT is reachable
+        if not self.order:
+            return None
+        queue = [(len(self.blocks[0].instructions), 0)]
+        done = set()
+        while queue:
+            length, start = heapq.heappop(queue)
+            if start in done:
+                continue
+            done.add(start)
+            if self.blocks[start].halts:
+                return length
+            for successor in self.blocks[start].successors:
+                if successor not in done:
+                    heapq.heappush(queue, (length + len(self.blocks[successor].instructions), successor))
+        return None
+
+    def cpi_bounds(self):
+        # (lower, upper) bound of the five stage core CPI, None without reachable instructions
+        blocks = self.reachable_blocks()
+        if not blocks:
+            return None
+        if not self.back_edges:
+            paths = self.halting_paths()
+            if paths is not None:
+                fewest_instructions, most_instructions, fewest_cycles, most_cycles = paths
+                return fewest_cycles / most_instructions, (most_cycles + DRAIN_CYCLES) / fewest_instructions
+        # any run is a mix of executions of its blocks: its CPI lies between the block CPIs
+        lower = min(block.cycles()[0] / len(block.instructions) for block in blocks)
+        upper = max(block.cycles()[1] / len(block.instructions) for block in blocks)
+        shortest = self.shortest_run()
+        if shortest is not None:
+            upper += DRAIN_CYCLES / shortest
+        return lower, upper
+
+    def loop_headers(self) -> list:
+        return sorted({head for _, head in self.back_edges})
+
+    def loop_depths(self) -> dict:
+        # start address -> number of natural loops containing the block, one loop per header: the blocks reaching a
+        # back edge into the header without passing it
+        depths = {start: 0 for start in self.order}
+        for head in self.loop_headers():
+            body = {head}
+            pending = [tail for tail, target in self.back_edges if target == head and tail != head]
+            body.update(pending)
+            while pending:
+                for predecessor in self.blocks[pending.pop()].predecessors:
+                    if predecessor in depths and predecessor not in body:
+                        body.add(predecessor)
+                        pending.append(predecessor)
+            for start in body:
+                depths[start] += 1
+        return depths
+
+    def cpi_estimate(self):
+        # point estimate for triage: blocks weighted by LOOP_WEIGHT per enclosing loop, unknown branch outcomes
+        # and entry stalls counted half, plus one pipeline drain
+        depths = self.loop_depths()
+        cycles = DRAIN_CYCLES if any(block.halts for block in self.reachable_blocks()) else 0
+        instructions = 0
+        for start, depth in depths.items():
+            block = self.blocks[start]
+            weight = LOOP_WEIGHT ** depth
+            cycles += weight * sum(block.cycles()) / 2
+            instructions += weight * len(block.instructions)
+        return cycles / instructions if instructions else None
+
+    def summary(self) -> dict:
+        blocks = self.reachable_blocks()
+        instructions = [instruction for block in blocks for instruction in block.instructions]
+        terminators = [block.terminator for block in blocks if is_control(block.terminator)]
+        branches = [branch for branch in terminators if format_of(branch) == "B"]
+        mix = {}
+        for instruction in instructions:
+            mix[instruction.mnemonic] = mix.get(instruction.mnemonic, 0) + 1
+        bounds = self.cpi_bounds()
+        return {
+            "words": len(self.table),
+            "instructions": len(instructions),  # reachable from PC 0
+            "blocks": len(blocks),
+            "edges": sum(len(block.successors) for block in blocks),
+            "loops": len(self.loop_headers()),
+            "halts": any(block.halts for block in blocks),
+            "exits": sum(block.exits for block in blocks),
+            "unsupported": sum(1 for block in blocks if block.terminator.handler is None and not block.halts),
+            "branches": len(branches),
+            "backward_branches": sum(1 for branch in branches if branch.imm <= 0),
+            "static_branches": sum(1 for branch in branches if branch_direction(branch) is not None),
+            "jumps": len(terminators) - len(branches),
+            "load_use": sum(block.load_use + block.entry_stall for block in blocks),
+            "definitions": len(self.def_use),
+            "dead_definitions": sum(1 for uses in self.def_use.values() if not uses),
+            "def_use_edges": sum(len(uses) for uses in self.def_use.values()),
+            "inputs": sorted(self.inputs),
+            "mix": dict(sorted(mix.items())),
+            "predictor": self.predictor,
+            "cpi_bounds": list(bounds) if bounds is not None else None,
+            "cpi_estimate": self.cpi_estimate(),
+        }
+
+
+def merge_states(states: list) -> tuple:
+    # union of the reaching definitions of several predecessors, register by register
+    if len(states) == 1:
+        return states[0]
+    merged = []
+    for definitions in zip(*states):
+        first = definitions[0]
+        if all(other is first for other in definitions):
+            merged.append(first)
+        else:
+            merged.append(frozenset().union(*definitions))
+    return tuple(merged)
+
+
+def analyze(path: str, predictor: str = StaticNotTaken.name) -> ProgramAnalysis:
+    # path: program image, or a directory holding imem.<extension>
+    if os.path.isdir(path):
+        path = find_input(path, "imem")
+    return ProgramAnalysis(decode_table(load_program(path)), predictor)
+
+
+def format_summary(path: str, summary: dict) -> str:
+    bounds = summary["cpi_bounds"]
+    cpi = "CPI n/a"
+    if bounds is not None:
+        cpi = f"CPI ~{summary['cpi_estimate']:.3f} ({bounds[0]:.3f}-{bounds[1]:.3f})"
+    return (f"{path}: {summary['instructions']} instructions, {summary['blocks']} blocks, {summary['loops']} loops, "
+            f"{summary['branches']} branches ({summary['backward_branches']} backward), {summary['jumps']} jumps, "
+            f"{summary['load_use']} load-use, {cpi}" + ("" if summary["halts"] else ", never halts"))
+
+
+def format_blocks(analysis: ProgramAnalysis) -> list:
+    lines = []
+    for block in sorted(analysis.reachable_blocks(), key=lambda block: block.start):
+        fewest, most = block.cycles()
+        successors = ", ".join(f"{successor:#x}" for successor in block.successors) or "-"
+        lines.append(f"  {block.start:#06x}-{block.end - 4:#06x} {len(block.instructions):5d} instructions "
+                     f"{fewest}-{most} cycles, {block.load_use + block.entry_stall} load-use -> {successors}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Static analysis of RV32I programs')
+    parser.add_argument("programs", nargs="+", type=str,
+                        help="Program images or directories holding imem.txt (or .bin, .raw, .hex, .elf).")
+    parser.add_argument("--predictor", default=StaticNotTaken.name, choices=list(PREDICTORS),
+                        help="Branch predictor of the five stage core the CPI bounds assume (default not-taken).")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per program.")
+    parser.add_argument("--blocks", action="store_true", help="List the reachable basic blocks of every program.")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.programs:
+        try:
+            analysis = analyze(path, args.predictor)
+        except (OSError, ValueError) as error:
+            print(f"{path}: {error}", file=sys.stderr)
+            failed += 1
+            continue
+        summary = analysis.summary()
+        if args.json:
+            print(json.dumps(dict(program=path, **summary)))
+        else:
+            print(format_summary(path, summary))
+        if args.blocks:
+            print("\n".join(format_blocks(analysis)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
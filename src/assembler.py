@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+RV32I assembler for the Code.asm syntax of the tests
+Encodes with the field layouts of encoding.json and writes imem.txt (one byte per line, most significant byte
+first). Accepted syntax, one instruction per line:
+
+    [ADDRESS:] [LABEL:] MNEMONIC operands   // comment
+
+    LW R1, R0, #0        ADDI R18, R2, #2047      SW R3, R0, #8       (SW rs2, rs1, #imm stores rs2 at rs1 + imm)
+    BNE R5, R3, #8       BNE R5, R3, B2           JAL R10, FN         HALT
+
+Registers are R0-R31 (or x0-x31), immediates #decimal or #0xhex, branch / jump targets a byte offset from the
+instruction or a label. Leading ADDRESS: numbers are listing annotations and ignored, /* */ blocks are comments.
+
+    python assembler.py Code.asm [-o imem.txt]
+"""
+
+import argparse
+import functools
+import json
+import os
+import re
+import sys
+from typing import NamedTuple
+
+ENCODING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "encoding.json")
+
+# operands of every encoding.json format, in assembly order
+OPERANDS = {
+    "R-Type": ("rd", "rs1", "rs2"),
+    "I-Type (Imm)": ("rd", "rs1", "imm"),
+    "I-Type (Load)": ("rd", "rs1", "imm"),
+    "S-Type (Store)": ("rs2", "rs1", "imm"),
+    "B-Type": ("rs1", "rs2", "imm"),
+    "J-Type": ("rd", "imm"),
+    "Special": (),
+}
+REGISTER_FIELDS = ("rd", "rs1", "rs2")
+
+LABEL = re.compile(r"([A-Za-z_.][\w.]*)\s*:")
+ADDRESS = re.compile(r"\d+\s*:")
+REGISTER = re.compile(r"[rRxX](\d+)$")
+
+
+class Encoding(NamedTuple):
+    # encoding.json entry compiled to shifts and masks
+    mnemonic: str
+    format: str
+    operands: tuple  # operand names in assembly order
+    base: int  # constant bits of the word
+    registers: tuple  # (operand, shift) of the register fields
+    immediate: tuple  # (immediate bit, width, shift) of every immediate slice
+    imm_bits: int  # signed immediate width, 0 without immediate
+    imm_align: int  # low immediate bits that are implied zero
+
+    def encode(self, operands: dict) -> int:
+        word = self.base
+        for name, shift in self.registers:
+            register = operands[name]
+            if not 0 <= register < 32:
+                raise ValueError(f"Invalid register: x{register}")
+            word |= register << shift
+        if self.immediate:
+            imm = operands["imm"]
+            if not -(1 << (self.imm_bits - 1)) <= imm < (1 << (self.imm_bits - 1)):
+                raise ValueError(f"Immediate out of range: {imm} does not fit {self.imm_bits} bits")
+            if imm % (1 << self.imm_align):
+                raise ValueError(f"Immediate not aligned: {imm} is not a multiple of {1 << self.imm_align}")
+            for bit, width, shift in self.immediate:
+                word |= ((imm >> bit) & ((1 << width) - 1)) << shift
+        return word
+
+
+def parse_bits(bits: str):
+    # "31:27" -> (31, 27), "11" -> (11, 11)
+    high, _, low = bits.partition(":")
+    return int(high), int(low or high)
+
+
+def compile_encoding(entry: dict) -> Encoding:
+    base = 0
+    registers = []
+    immediate = []
+    for bits, value in entry["fields"].items():
+        high, low = parse_bits(bits)
+        if value in REGISTER_FIELDS:
+            registers.append((value, low))
+        elif value.startswith("imm[") and value.endswith("]"):
+            # slices listed from the most significant instruction bit down, e.g. imm[20|10:1|11|19:12]
+            position = high + 1
+            for part in value[4:-1].split("|"):
+                top, bottom = parse_bits(part)
+                position -= top - bottom + 1
+                immediate.append((bottom, top - bottom + 1, position))
+            if position != low:
+                raise ValueError(f"Invalid encoding of {entry['mnemonic']}: {value} does not fill bits {bits}")
+        elif value and set(value) <= {"0", "1"}:
+            base |= int(value, 2) << low
+        elif value and set(value) == {"x"}:
+            # don't care bits are set: HALT is the all ones word
+            base |= ((1 << (high - low + 1)) - 1) << low
+        else:
+            raise ValueError(f"Invalid encoding of {entry['mnemonic']}: field {bits} = {value}")
+    imm_bits = max((bit + width for bit, width, _ in immediate), default=0)
+    imm_align = min((bit for bit, _, _ in immediate), default=0)
+    return Encoding(mnemonic=entry["mnemonic"].upper(),
+                    format=entry["format"],
+                    operands=OPERANDS[entry["format"]],
+                    base=base,
+                    registers=tuple(registers),
+                    immediate=tuple(immediate),
+                    imm_bits=imm_bits,
+                    imm_align=imm_align)
+
+
+@functools.lru_cache(maxsize=None)
+def encoding_table(path: str = ENCODING_PATH) -> dict:
+    # mnemonic -> Encoding, compiled once per encoding file
+    with open(path) as file:
+        entries = json.load(file)["instruction_encodings"]
+    return {encoding.mnemonic: encoding for encoding in map(compile_encoding, entries)}
+
+
+def encode(mnemonic: str, *operands: int) -> int:
+    # encode("ADDI", rd, rs1, imm) -> instruction word, operands in assembly order
+    encoding = encoding_table().get(mnemonic.upper())
+    if encoding is None:
+        raise ValueError(f"Unknown instruction: {mnemonic}")
+    if len(operands) != len(encoding.operands):
+        raise ValueError(f"{encoding.mnemonic} takes {len(encoding.operands)} operands, got {len(operands)}")
+    return encoding.encode(dict(zip(encoding.operands, operands)))
+
+
+def strip_comments(source: str) -> str:
+    # drop /* */ blocks (keeping their line breaks) and // comments
+    source = re.sub(r"/\*.*?\*/", lambda match: "\n" * match.group().count("\n"), source, flags=re.S)
+    return re.sub(r"//[^\n]*", "", source)
+
+
+def parse_line(line: str):
+    # (labels, mnemonic or None, operand strings) of one source line
+    line = line.strip()
+    match = ADDRESS.match(line)
+    if match:
+        line = line[match.end():].strip()
+    labels = []
+    match = LABEL.match(line)
+    while match:
+        labels.append(match.group(1))
+        line = line[match.end():].strip()
+        match = LABEL.match(line)
+    if not line:
+        return labels, None, []
+    mnemonic, rest = (line.split(None, 1) + [""])[:2]
+    operands = [operand.strip() for operand in rest.split(",")] if rest.strip() else []
+    return labels, mnemonic.upper(), operands
+
+
+def parse_register(operand: str) -> int:
+    match = REGISTER.match(operand)
+    if not match:
+        raise ValueError(f"Invalid register: {operand}")
+    return int(match.group(1))
+
+
+def parse_immediate(operand: str) -> int:
+    try:
+        return int(operand[1:] if operand.startswith("#") else operand, 0)
+    except ValueError:
+        raise ValueError(f"Invalid immediate: {operand}")
+
+
+def assemble(source: str) -> list:
+    # Code.asm text -> instruction words
+    table = encoding_table()
+    labels = {}
+    lines = []  # (line number, pc, mnemonic, operands)
+    for number, line in enumerate(strip_comments(source).splitlines(), 1):
+        line_labels, mnemonic, operands = parse_line(line)
+        pc = len(lines) * 4
+        for label in line_labels:
+            if label in labels:
+                raise ValueError(f"line {number}: duplicate label {label}")
+            labels[label] = pc
+        if mnemonic is not None:
+            lines.append((number, pc, mnemonic, operands))
+
+    words = []
+    for number, pc, mnemonic, operands in lines:
+        try:
+            encoding = table.get(mnemonic)
+            if encoding is None:
+                raise ValueError(f"Unknown instruction: {mnemonic}")
+            if len(operands) != len(encoding.operands):
+                raise ValueError(f"{mnemonic} takes {len(encoding.operands)} operands, got {len(operands)}")
+            values = {}
+            for name, operand in zip(encoding.operands, operands):
+                if name != "imm":
+                    values[name] = parse_register(operand)
+                elif encoding.format in ("B-Type", "J-Type") and operand in labels:
+                    values[name] = labels[operand] - pc
+                elif encoding.format in ("B-Type", "J-Type") and LABEL.fullmatch(operand + ":"):
+                    raise ValueError(f"Undefined label: {operand}")
+                else:
+                    values[name] = parse_immediate(operand)
+            words.append(encoding.encode(values))
+        except ValueError as error:
+            raise ValueError(f"line {number}: {error}")
+    return words
+
+
+def assemble_file(path: str) -> list:
+    with open(path) as file:
+        return assemble(file.read())
+
+
+def write_bytes(words) -> list:
+    # 8-bit binary strings of the words, most significant byte first
+    return ['{:08b}'.format((word >> shift) & 0xff) for word in words for shift in (24, 16, 8, 0)]
+
+
+def write_imem(words, path: str):
+    with open(path, "w") as file:
+        file.write("\n".join(write_bytes(words)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RV32I assembler for the Code.asm syntax')
+    parser.add_argument("source", type=str, help="Assembly source file.")
+    parser.add_argument("-o", "--output", default="imem.txt", type=str, help="Output imem.txt path.")
+    args = parser.parse_args()
+
+    try:
+        words = assemble_file(args.source)
+    except ValueError as error:
+        print(f"{args.source}: {error}", file=sys.stderr)
+        return 1
+    write_imem(words, args.output)
+    print(f"{len(words)} instructions written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
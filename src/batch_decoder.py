@@ -0,0 +1,77 @@
+import functools
+
+from assembler import encoding_table
+
+try:
+    import numpy
+except ImportError:  # optional - without NumPy predecode decodes word by word (decoder.py)
+    numpy = None
+
+# Batch decoder of whole instruction images. The encoding.json table (compiled once by the assembler) becomes
+# mask / match pairs: a word is an instruction when its fixed bits (opcode, funct3, funct7) equal the match. Every
+# pair is tested on the whole image with NumPy bitwise operations and the register fields / sign-extended
+# immediates of the matching rows are extracted at once.
+#
+# decode_image() returns a structured array with one row per 32-bit word:
+#   mnemonic  index into mnemonics(), -1 where no encoding matches
+#   rd, rs1, rs2, imm  fields of the instruction's format, 0 where the format has none
+# The Special HALT entry matches the all ones word only, like the cores.
+
+DECODED_DTYPE = [("mnemonic", "i2"), ("rd", "u1"), ("rs1", "u1"), ("rs2", "u1"), ("imm", "i4")]
+
+
+@functools.lru_cache(maxsize=None)
+def compile_masks() -> tuple:
+    # ((mnemonic, mask, match, encoding), ...) of the encoding.json table, compiled on first use
+    compiled = []
+    for mnemonic, encoding in encoding_table().items():
+        variable = 0
+        for _, shift in encoding.registers:
+            variable |= 0x1f << shift
+        for _, width, shift in encoding.immediate:
+            variable |= ((1 << width) - 1) << shift
+        mask = ~variable & 0xffffffff
+        compiled.append((mnemonic, mask, encoding.base & mask, encoding))
+    return tuple(compiled)
+
+
+def mnemonics() -> list:
+    # mnemonic of every id of the decoded arrays
+    return [mnemonic for mnemonic, _, _, _ in compile_masks()]
+
+
+def available() -> bool:
+    return numpy is not None
+
+
+def image_words(image):
+    # big-endian 32-bit words of an instruction memory image (bytes, bytearray or mmap)
+    return numpy.frombuffer(image, dtype=">u4", count=len(image) // 4).astype(numpy.uint32)
+
+
+def decode_words(words):
+    words = numpy.asarray(words, dtype=numpy.uint32)
+    decoded = numpy.zeros(len(words), dtype=DECODED_DTYPE)
+    decoded["mnemonic"] = -1
+    pending = numpy.ones(len(words), dtype=bool)
+    for number, (_, mask, match, encoding) in enumerate(compile_masks()):
+        hit = pending & ((words & numpy.uint32(mask)) == numpy.uint32(match))
+        if not hit.any():
+            continue
+        pending &= ~hit
+        selected = words[hit]
+        decoded["mnemonic"][hit] = number
+        for name, shift in encoding.registers:
+            decoded[name][hit] = (selected >> numpy.uint32(shift)) & numpy.uint32(0x1f)
+        if encoding.immediate:
+            imm = numpy.zeros(len(selected), dtype=numpy.int64)
+            for bit, width, shift in encoding.immediate:
+                field = (selected >> numpy.uint32(shift)) & numpy.uint32((1 << width) - 1)
+                imm |= field.astype(numpy.int64) << bit
+            sign = 1 << (encoding.imm_bits - 1)
+            decoded["imm"][hit] = (imm ^ sign) - sign
+    return decoded
+
+
+def decode_image(image):
+    return decode_words(image_words(image))
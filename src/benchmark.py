@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Host throughput benchmark
+Runs generated RV32I workloads (long ALU chains, load-use heavy loops, branchy loops, store heavy memcpy, a
+synthetic random mix from workload.py) and the
+T0-T2 tests on the single stage and five stage cores, with and without trace output, and reports simulated
+instructions / cycles per host second. Every invocation appends one JSON line to the results file so host
+throughput can be tracked across commits.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from models import InsMem, DataMem
+from program_builder import ProgramBuilder
+from regression import discover_tests
+from rv32i import SingleStageCore, FiveStageCore
+from tracing import TracePolicy
+from workload import WorkloadConfig, generate
+
+CORES = {
+    "SS": SingleStageCore,
+    "FS": FiveStageCore,
+}
+TRACES = ("none", "full")
+
+
+def alu_chain(iterations: int, chain: int = 16) -> ProgramBuilder:
+    # back to back dependent ALU instructions - exercises EX->ID / MEM->ID forwarding. The register values
+    # stay bounded (the cores compute with unbounded Python ints, growing values would measure bignum speed)
+    program = ProgramBuilder()
+    program.load_constant(1, iterations)
+    program.addi(2, 0, 1)
+    program.addi(3, 0, 3)
+    program.addi(4, 0, 0x7ff)
+    program.label("loop")
+    operations = ((program.add, 3), (program.xor, 3), (program.sub, 3), (program.and_, 4), (program.or_, 3))
+    for k in range(chain):
+        operation, rs2 = operations[k % len(operations)]
+        operation(2, 2, rs2)
+    program.addi(1, 1, -1)
+    program.bne(1, 0, "loop")
+    program.halt()
+    return program
+
+
+def load_use(iterations: int) -> ProgramBuilder:
+    # every load is used by the next instruction - one load-use stall per load on the five stage core
+    program = ProgramBuilder()
+    program.data_words(range(1, 65))
+    program.load_constant(1, iterations)
+    program.label("loop")
+    program.lw(2, 4, 0)
+    program.add(3, 3, 2)
+    program.lw(5, 4, 4)
+    program.xor(6, 6, 5)
+    program.addi(4, 4, 8)
+    program.andi(4, 4, 0xf8)
+    program.addi(1, 1, -1)
+    program.bne(1, 0, "loop")
+    program.halt()
+    return program
+
+
+def branchy(iterations: int) -> ProgramBuilder:
+    # data dependent branches and jumps taken with alternating patterns
+    program = ProgramBuilder()
+    program.load_constant(1, iterations)
+    program.label("loop")
+    program.andi(2, 1, 1)
+    program.beq(2, 0, "even")
+    program.addi(3, 3, 1)
+    program.jal(0, "next")
+    program.label("even")
+    program.addi(4, 4, 1)
+    program.label("next")
+    program.andi(5, 1, 3)
+    program.bne(5, 0, "skip")
+    program.addi(6, 6, 1)
+    program.label("skip")
+    program.addi(1, 1, -1)
+    program.bne(1, 0, "loop")
+    program.halt()
+    return program
+
+
+def memcpy(words: int) -> ProgramBuilder:
+    # copy words 32-bit words to the area right after them
+    program = ProgramBuilder()
+    program.data_words(range(words))
+    program.load_constant(1, words)
+    program.addi(5, 0, 0)
+    program.load_constant(6, words * 4)
+    program.label("loop")
+    program.lw(2, 5, 0)
+    program.sw(2, 6, 0)
+    program.addi(5, 5, 4)
+    program.addi(6, 6, 4)
+    program.addi(1, 1, -1)
+    program.bne(1, 0, "loop")
+    program.halt()
+    return program
+
+
+def synthetic(trips: int) -> ProgramBuilder:
+    # random mix of the default workload generator parameters
+    return generate(WorkloadConfig(trips=trips))
+
+
+# workload -> (generator, iterations at scale 1)
+WORKLOADS = {
+    "alu_chain": (alu_chain, 300),
+    "load_use": (load_use, 1000),
+    "branchy": (branchy, 1000),
+    "memcpy": (memcpy, 1000),
+    "synthetic": (synthetic, 20),
+}
+
+
+def prepare_workloads(work_dir: str, scale: float, names, test_roots) -> dict:
+    # workload name -> directory holding its imem.txt / dmem.txt
+    programs = {}
+    for name in names:
+        generator, iterations = WORKLOADS[name]
+        io_dir = os.path.join(work_dir, name)
+        generator(max(1, int(iterations * scale))).write(io_dir)
+        programs[name] = io_dir
+    for test_dir in discover_tests(test_roots):
+        programs[os.path.basename(test_dir)] = test_dir
+    return programs
+
+
+def run_once(program_dir: str, run_dir: str, stages: str, trace: str):
+    # (instructions, cycles, seconds) of one complete run - the time covers building the core, stepping it to
+    # halt and flushing its traces, not reading the input files
+    os.makedirs(run_dir, exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # InsMem prints the input path
+        imem = InsMem("Imem", program_dir)
+    dmem = DataMem(stages, program_dir)
+    start = time.perf_counter()
+    core = CORES[stages](run_dir, imem, dmem, trace_policy=TracePolicy(trace))
+    try:
+        while not core.halted:
+            core.step()
+    finally:
+        core.close_traces()
+    elapsed = time.perf_counter() - start
+    return core.state.IF.instruction_count, core.cycle, elapsed
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RV32I simulator host throughput benchmark')
+    parser.add_argument("--scale", default=1.0, type=float, help="Multiplier of the generated workload sizes.")
+    parser.add_argument("--repeat", default=3, type=int, help="Runs per measurement, the fastest one is reported.")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        help="Comma separated generated workloads: " + ", ".join(WORKLOADS) + ".")
+    parser.add_argument("--tests", nargs="*", default=[os.path.join(os.path.dirname(__file__), "..", "submissions", "Test")],
+                        help="Test directories added to the generated workloads (default: submissions/Test).")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "..", "benchmark_results.jsonl"),
+                        type=str, help="JSON lines file the results are appended to (default: benchmark_results.jsonl "
+                                       "in the repository root, ignored by git).")
+    args = parser.parse_args()
+
+    names = [name for name in args.workloads.split(",") if name]
+    for name in names:
+        if name not in WORKLOADS:
+            parser.error(f"unknown workload: {name}")
+
+    work_dir = tempfile.mkdtemp(prefix="rv32i_bench_")
+    results = []
+    try:
+        programs = prepare_workloads(work_dir, args.scale, names, args.tests)
+        print(f"{'workload':12s} {'core':4s} {'trace':5s} {'instructions':>12s} {'cycles':>9s} {'seconds':>9s} "
+              f"{'instr/s':>10s} {'cycles/s':>10s}")
+        for name, program_dir in programs.items():
+            for stages in CORES:
+                for trace in TRACES:
+                    run_dir = os.path.join(work_dir, "run", name, stages + "_" + trace)
+                    runs = [run_once(program_dir, run_dir, stages, trace) for _ in range(max(1, args.repeat))]
+                    instructions, cycles, seconds = min(runs, key=lambda run: run[2])
+                    result = {
+                        "workload": name,
+                        "core": stages,
+                        "trace": trace,
+                        "instructions": instructions,
+                        "cycles": cycles,
+                        "seconds": seconds,
+                        "instructions_per_second": instructions / seconds,
+                        "cycles_per_second": cycles / seconds,
+                    }
+                    results.append(result)
+                    print(f"{name:12s} {stages:4s} {trace:5s} {instructions:12d} {cycles:9d} {seconds:9.4f} "
+                          f"{result['instructions_per_second']:10.0f} {result['cycles_per_second']:10.0f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    record = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "a") as file:
+        file.write(json.dumps(record) + "\n")
+    print(f"Results appended to {os.path.abspath(args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
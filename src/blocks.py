@@ -0,0 +1,106 @@
+from typing import Callable, NamedTuple, Optional
+
+from models import DecodedInstruction
+from predecode import DecodedProgram
+
+# Basic block translation for SingleStageCore. A basic block is the straight-line run of instructions starting at
+# a PC and ending with (and including) the first BEQ / BNE / JAL. It is compiled once into a generated Python
+# function executing the whole run on the register list and returning the next PC; blocks are kept in a PC keyed
+# cache. HALT, undecodable and unsupported words end a block without being part of it - the interpreted step()
+# executes them, so halting and errors happen in exactly the same cycle as without translation.
+# Every instruction of a block still counts as one cycle and one instruction of the single stage core.
+
+# straight-line instructions: mnemonic -> expression assigned to regs[rd]
+EXPRESSIONS = {
+    "add": "regs[{rs1}] + regs[{rs2}]",
+    "sub": "regs[{rs1}] - regs[{rs2}]",
+    "xor": "regs[{rs1}] ^ regs[{rs2}]",
+    "or": "regs[{rs1}] | regs[{rs2}]",
+    "and": "regs[{rs1}] & regs[{rs2}]",
+    "addi": "regs[{rs1}] + {imm}",
+    "xori": "regs[{rs1}] ^ {imm}",
+    "ori": "regs[{rs1}] | {imm}",
+    "andi": "regs[{rs1}] & {imm}",
+    "lw": "read_data(regs[{rs1}] + {imm})",
+}
+BRANCHES = {
+    "beq": "==",
+    "bne": "!=",
+}
+
+
+class TranslatedBlock(NamedTuple):
+    pc: int  # address of the first instruction
+    length: int  # number of instructions, each one is one single stage cycle
+    function: Callable  # function(regs, read_data, write_data) -> next PC
+    source: str  # generated code, kept for debugging
+
+
+def translate_instruction(instruction: DecodedInstruction, pc: int) -> Optional[list]:
+    # lines of generated code for the instruction at pc, None if it does not belong in a block
+    if instruction.handler is None:
+        return None
+    fields = instruction._asdict()
+    mnemonic = instruction.mnemonic
+    if mnemonic in EXPRESSIONS:
+        # writes to x0 are dropped by RegisterFile.write_rf, the loads have no side effect
+        if instruction.rd == 0:
+            return []
+        return [f"regs[{instruction.rd}] = " + EXPRESSIONS[mnemonic].format(**fields)]
+    if mnemonic == "sw":
+        return ["write_data(regs[{rs1}] + {imm}, regs[{rs2}])".format(**fields)]
+    if mnemonic in BRANCHES:
+        return [f"if regs[{instruction.rs1}] {BRANCHES[mnemonic]} regs[{instruction.rs2}]:",
+                f"    return {pc + instruction.imm}",
+                f"return {pc + 4}"]
+    if mnemonic == "jal":
+        lines = [f"regs[{instruction.rd}] = {pc + 4}"] if instruction.rd != 0 else []
+        return lines + [f"return {pc + instruction.imm}"]
+    return None
+
+
+class BlockCache(object):
+    def __init__(self, program: DecodedProgram):
+        self.program = program
+        self.blocks = {}  # pc -> TranslatedBlock, None for a PC that starts with a non translatable instruction
+        self.version = program.version
+        self.translations = 0
+        self.dispatches = 0
+
+    def lookup(self, pc: int) -> Optional[TranslatedBlock]:
+        if self.version != self.program.version:
+            # instruction memory was written - drop every translation
+            self.blocks.clear()
+            self.version = self.program.version
+        try:
+            block = self.blocks[pc]
+        except KeyError:
+            block = self.blocks[pc] = self.translate(pc)
+        if block is not None:
+            self.dispatches += 1
+        return block
+
+    def translate(self, pc: int) -> Optional[TranslatedBlock]:
+        body = []
+        address = pc
+        ended = False
+        while 0 <= address >> 2 < len(self.program.table):
+            lines = translate_instruction(self.program.fetch(address), address)
+            if lines is None:
+                break
+            body.extend(lines)
+            address += 4
+            if lines and lines[-1].startswith("return"):
+                ended = True
+                break
+        length = (address - pc) >> 2
+        if length == 0:
+            return None
+        if not ended:
+            body.append(f"return {address}")
+
+        source = "def block(regs, read_data, write_data):\n" + "".join(f"    {line}\n" for line in body)
+        namespace = {}
+        exec(compile(source, f"<block {pc:#x}>", "exec"), namespace)
+        self.translations += 1
+        return TranslatedBlock(pc=pc, length=length, function=namespace["block"], source=source)
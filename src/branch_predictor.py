@@ -0,0 +1,140 @@
+import abc
+from typing import Optional
+
+# Branch prediction for the IF stage of the five stage core. IF asks predict(pc) for the next fetch address,
+# ID resolves BEQ / BNE / JAL, compares with the prediction carried in the ID latch, flushes on a
+# misprediction and trains the predictor with resolve().
+
+DEFAULT_BTB_ENTRIES = 64
+DEFAULT_TABLE_BITS = 10
+
+
+class BranchTargetBuffer(object):
+    # Direct mapped, tagged table pc -> (target, conditional) of branches / jumps seen taken
+
+    def __init__(self, entries: int = DEFAULT_BTB_ENTRIES):
+        self.entries = entries
+        self.tags = [None] * entries
+        self.targets = [0] * entries
+        self.conditional = [False] * entries
+
+    def lookup(self, pc: int):
+        # (target, conditional) on a hit, None on a miss
+        index = (pc >> 2) % self.entries
+        if self.tags[index] != pc:
+            return None
+        return self.targets[index], self.conditional[index]
+
+    def update(self, pc: int, target: int, conditional: bool):
+        index = (pc >> 2) % self.entries
+        self.tags[index] = pc
+        self.targets[index] = target
+        self.conditional[index] = conditional
+
+
+class BranchPredictor(metaclass=abc.ABCMeta):
+    name = ""
+
+    def __init__(self, btb_entries: int = DEFAULT_BTB_ENTRIES):
+        self.btb = BranchTargetBuffer(btb_entries)
+
+    @abc.abstractmethod
+    def predict_taken(self, pc: int, target: int) -> bool:
+        # direction of the conditional branch at pc, target as recorded in the BTB
+        pass
+
+    def update(self, pc: int, taken: bool):
+        # train the direction predictor with the resolved outcome of a conditional branch
+        pass
+
+    def predict(self, pc: int) -> Optional[int]:
+        # next fetch address after pc when predicted taken, None to fall through to pc + 4
+        entry = self.btb.lookup(pc)
+        if entry is None:
+            return None
+        target, conditional = entry
+        if not conditional or self.predict_taken(pc, target):
+            return target
+        return None
+
+    def resolve(self, pc: int, conditional: bool, taken: bool, target: int):
+        if conditional:
+            self.update(pc, taken)
+        if taken:
+            self.btb.update(pc, target, conditional)
+
+
+class StaticNotTaken(BranchPredictor):
+    # Always fetch pc + 4, every taken branch and every JAL flushes - the behavior without a predictor
+    name = "not-taken"
+
+    def predict_taken(self, pc: int, target: int) -> bool:
+        return False
+
+    def predict(self, pc: int) -> Optional[int]:
+        return None
+
+    def resolve(self, pc: int, conditional: bool, taken: bool, target: int):
+        pass
+
+
+class BackwardTakenForwardNotTaken(BranchPredictor):
+    # Static: backward branches (loops) taken, forward branches not taken. JALs taken on a BTB hit
+    name = "btfn"
+
+    def predict_taken(self, pc: int, target: int) -> bool:
+        return target <= pc
+
+
+class Bimodal(BranchPredictor):
+    # Table of 2-bit saturating counters indexed by pc, initialised weakly not taken
+    name = "bimodal"
+
+    def __init__(self, btb_entries: int = DEFAULT_BTB_ENTRIES, table_bits: int = DEFAULT_TABLE_BITS):
+        super(Bimodal, self).__init__(btb_entries)
+        self.mask = (1 << table_bits) - 1
+        self.counters = [1] * (1 << table_bits)
+
+    def index(self, pc: int) -> int:
+        return (pc >> 2) & self.mask
+
+    def predict_taken(self, pc: int, target: int) -> bool:
+        return self.counters[self.index(pc)] >= 2
+
+    def update(self, pc: int, taken: bool):
+        index = self.index(pc)
+        if taken:
+            self.counters[index] = min(3, self.counters[index] + 1)
+        else:
+            self.counters[index] = max(0, self.counters[index] - 1)
+
+
+class GShare(Bimodal):
+    # 2-bit counters indexed by pc xor the global history of conditional branch outcomes
+    name = "gshare"
+
+    def __init__(self, btb_entries: int = DEFAULT_BTB_ENTRIES, table_bits: int = DEFAULT_TABLE_BITS):
+        super(GShare, self).__init__(btb_entries, table_bits)
+        self.history = 0
+
+    def index(self, pc: int) -> int:
+        return ((pc >> 2) ^ self.history) & self.mask
+
+    def update(self, pc: int, taken: bool):
+        super(GShare, self).update(pc, taken)
+        self.history = ((self.history << 1) | int(taken)) & self.mask
+
+
+PREDICTORS = {
+    StaticNotTaken.name: StaticNotTaken,
+    BackwardTakenForwardNotTaken.name: BackwardTakenForwardNotTaken,
+    Bimodal.name: Bimodal,
+    GShare.name: GShare,
+}
+
+
+def make_predictor(name: str, btb_entries: int = DEFAULT_BTB_ENTRIES) -> BranchPredictor:
+    try:
+        return PREDICTORS[name](btb_entries)
+    except KeyError:
+        raise Exception(f"Invalid branch predictor: {name}")
@@ -0,0 +1,135 @@
+import random
+
+# L1 cache model of the five stage core. Only tags, valid / dirty bits and replacement state are kept - the
+# data itself stays in InsMem / DataMem, which remain the single source of truth - so a cache changes the
+# timing of a run (cycles, CPI) but never its results. access() returns the latency of one access in cycles;
+# the core freezes the pipeline for latency - 1 extra cycles.
+#
+# Write policies:
+#   back    - write allocate, a store marks the line dirty, evicting a dirty line costs another miss latency
+#   through - no write allocate, every store goes to memory through a write buffer and costs the hit latency
+
+REPLACEMENT_POLICIES = ("lru", "fifo", "random")
+WRITE_POLICIES = ("back", "through")
+
+
+class CacheConfig(object):
+    # Geometry and timing of one cache, parsed from "size=4096,assoc=2,line=16,policy=lru,write=back,hit=1,miss=10"
+
+    FIELDS = ("size", "assoc", "line", "policy", "write", "hit", "miss")
+
+    def __init__(self, size: int = 4096, assoc: int = 2, line: int = 16, policy: str = "lru", write: str = "back",
+                 hit: int = 1, miss: int = 10, seed: int = 0):
+        if size <= 0 or line <= 0 or assoc <= 0 or size & (size - 1) or line & (line - 1):
+            raise ValueError(f"Invalid cache geometry: size={size} line={line} (powers of two expected)")
+        if size % (line * assoc):
+            raise ValueError(f"Invalid cache geometry: size={size} is not a multiple of line * assoc")
+        if policy not in REPLACEMENT_POLICIES:
+            raise ValueError(f"Invalid replacement policy: {policy}")
+        if write not in WRITE_POLICIES:
+            raise ValueError(f"Invalid write policy: {write}")
+        if hit < 1 or miss < hit:
+            raise ValueError(f"Invalid cache latencies: hit={hit} miss={miss}")
+        self.size = size
+        self.assoc = assoc
+        self.line = line
+        self.policy = policy
+        self.write = write
+        self.hit = hit
+        self.miss = miss
+        self.seed = seed
+
+    @property
+    def sets(self) -> int:
+        return self.size // (self.line * self.assoc)
+
+    @classmethod
+    def parse(cls, spec: str) -> "CacheConfig":
+        # comma separated key=value pairs, missing keys keep their defaults
+        options = {}
+        for item in filter(None, spec.split(",")):
+            key, sep, value = item.partition("=")
+            key = key.strip()
+            if not sep or key not in cls.FIELDS:
+                raise ValueError(f"Invalid cache option: {item}")
+            options[key] = value.strip() if key in ("policy", "write") else int(value, 0)
+        return cls(**options)
+
+    def __str__(self):
+        return ",".join(f"{key}={getattr(self, key)}" for key in self.FIELDS)
+
+
+class Cache(object):
+    def __init__(self, name: str, config: CacheConfig):
+        self.name = name
+        self.config = config
+        self.offset_bits = config.line.bit_length() - 1
+        self.sets = config.sets
+        # per set: list of tags ordered by replacement priority, the first one is evicted next.
+        # LRU moves a tag to the end on every hit, FIFO only on fill, random ignores the order.
+        self.lines = [[] for _ in range(self.sets)]
+        self.dirty = [set() for _ in range(self.sets)]
+        self.random = random.Random(config.seed)
+        self.hits = 0
+        self.misses = 0
+        self.writebacks = 0
+        self.stall_cycles = 0  # cycles above the hit latency caused by this cache
+
+    def access(self, address: int, write: bool = False) -> int:
+        config = self.config
+        block = (address & 0xffffffff) >> self.offset_bits
+        index = block % self.sets
+        tag = block // self.sets
+        lines = self.lines[index]
+
+        if tag in lines:
+            self.hits += 1
+            if config.policy == "lru":
+                lines.remove(tag)
+                lines.append(tag)
+            if write and config.write == "back":
+                self.dirty[index].add(tag)
+            return config.hit
+
+        self.misses += 1
+        if write and config.write == "through":
+            # no write allocate - the store is absorbed by the write buffer
+            return config.hit
+
+        latency = config.miss
+        if len(lines) == config.assoc:
+            victim = lines.pop(self.random.randrange(config.assoc) if config.policy == "random" else 0)
+            if victim in self.dirty[index]:
+                self.dirty[index].discard(victim)
+                self.writebacks += 1
+                latency += config.miss
+        lines.append(tag)
+        if write:
+            self.dirty[index].add(tag)
+        self.stall_cycles += latency - config.hit
+        return latency
+
+    @property
+    def accesses(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.accesses if self.accesses else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "config": str(self.config),
+            "accesses": self.accesses,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "writebacks": self.writebacks,
+            "stall_cycles": self.stall_cycles,
+        }
+
+    def metrics(self) -> str:
+        # lines appended to the five stage core performance metrics
+        return f"{self.name} accesses: {self.accesses}, hits: {self.hits}, misses: {self.misses}, " \
+               f"hit rate: {self.hit_rate}\n" \
+               f"{self.name} stall cycles: {self.stall_cycles}\n"
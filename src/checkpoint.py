@@ -0,0 +1,242 @@
+import base64
+import hashlib
+import json
+import zlib
+
+from functional import FunctionalCore
+from models import InsMem, DataMem, State, PageSize
+from predecode import decode_word
+from rv32i import Core, SingleStageCore, FiveStageCore
+
+# Checkpoint / restore of simulator state as a compact JSON document:
+#   - architectural state: PC, registers, the touched DataMem pages (zlib + base64) and the dump size
+#   - timing core state: cycle, pipeline latches of State and the five stage core counters
+# Latches hold InstructionBase objects (instruction_ob) which are never serialized - a latch stores the
+# instruction word and the object is rebuilt from its predecoded record on restore. Branch predictor and
+# cache contents are warm-up state and start cold after a restore.
+#
+# Snapshots are taken between cycles, where nextState is a copy of state, so only state is stored.
+# A functional (or single stage) snapshot can be restored into any core: the five stage core starts with an
+# empty pipeline fetching from the saved PC, and its cycle / instruction counts start from 0 so the metrics
+# cover the detailed region only. A five stage snapshot with instructions in flight restores into a five stage core.
+
+CHECKPOINT_VERSION = 1
+STAGES = ("IF", "ID", "EX", "MEM", "WB")
+KINDS = {
+    SingleStageCore: "SS",
+    FiveStageCore: "FS",
+    FunctionalCore: "FUNC",
+}
+
+
+def program_digest(imem: InsMem) -> str:
+    # identifies the program a snapshot belongs to: sha256 of its imem.txt bits, whatever format it was loaded from
+    size = len(imem.IMem)
+    bits = '{:0{}b}'.format(int.from_bytes(imem.IMem, "big"), 8 * size) if size else ""
+    return hashlib.sha256(bits.encode()).hexdigest()
+
+
+def dump_dmem(dmem: DataMem) -> dict:
+    pages = {}
+    for number, page in sorted(dmem.pages.items()):
+        if any(page):
+            pages[str(number)] = base64.b64encode(zlib.compress(bytes(page))).decode()
+    return {"size": dmem.size, "pages": pages}
+
+
+def load_dmem(dmem: DataMem, snapshot: dict):
+    dmem.pages = {}
+    for number, data in snapshot["pages"].items():
+        page = bytearray(zlib.decompress(base64.b64decode(data)))
+        if len(page) != PageSize:
+            raise Exception(f"Invalid checkpoint: page {number} has {len(page)} bytes")
+        dmem.pages[int(number)] = page
+    dmem.size = snapshot["size"]
+
+
+def dump_latch(latch) -> dict:
+    fields = latch.fields()
+    if fields.get("instruction_ob") is not None:
+        fields["instruction_ob"] = fields["instruction_ob"].instruction.word
+    return fields
+
+
+def load_latch(latch, fields: dict, core: Core):
+    for name, value in fields.items():
+        if name == "instruction_ob" and value is not None:
+            record = decode_word(value)
+            value = record.handler(record, core.ext_dmem, core.myRF, core.state, core.nextState)
+        setattr(latch, name, value)
+
+
+def take_checkpoint(core) -> dict:
+    if isinstance(core, FunctionalCore):
+        return {
+            "version": CHECKPOINT_VERSION,
+            "kind": KINDS[type(core)],
+            "program": program_digest(core.program.imem),
+            "halted": core.halted,
+            "cycle": core.instruction_count,
+            "instruction_count": core.instruction_count,
+            "pc": core.pc,
+            "registers": list(core.registers),
+            "dmem": dump_dmem(core.dmem),
+        }
+
+    snapshot = {
+        "version": CHECKPOINT_VERSION,
+        "kind": KINDS[type(core)],
+        "program": program_digest(core.ext_imem),
+        "halted": core.halted,
+        "cycle": core.cycle,
+        "instruction_count": core.state.IF.instruction_count,
+        "pc": core.state.IF.PC,
+        "registers": list(core.myRF.registers),
+        "dmem": dump_dmem(core.ext_dmem),
+        "state": {stage: dump_latch(getattr(core.state, stage)) for stage in STAGES},
+    }
+    if core.counters is not None:
+        counters = dict(vars(core.counters))
+        counters.pop("caches")
+        snapshot["counters"] = counters
+    if isinstance(core, FiveStageCore):
+        snapshot["pending_stall"] = core.pending_stall
+    return snapshot
+
+
+def pipeline_empty(snapshot: dict) -> bool:
+    return all(snapshot["state"][stage]["nop"] for stage in STAGES[1:])
+
+
+def restore_checkpoint(core, snapshot: dict):
+    # Load snapshot into a freshly constructed core running the same program
+    if snapshot.get("version") != CHECKPOINT_VERSION:
+        raise Exception(f"Unsupported checkpoint version: {snapshot.get('version')}")
+    imem = core.program.imem if isinstance(core, FunctionalCore) else core.ext_imem
+    if snapshot["program"] != program_digest(imem):
+        raise Exception("Checkpoint was taken from a different program")
+    if snapshot["halted"]:
+        raise Exception("Checkpoint was taken after the program halted, there is nothing left to run")
+
+    kind = KINDS[type(core)]
+    if not compatible(core, snapshot):
+        raise Exception("A five stage checkpoint with instructions in flight restores into a five stage core only")
+
+    if isinstance(core, FunctionalCore):
+        load_dmem(core.dmem, snapshot["dmem"])
+        core.registers[:] = snapshot["registers"]
+        core.pc = snapshot["pc"]
+        core.instruction_count = snapshot["instruction_count"]
+        core.halted = snapshot["halted"]
+        return
+
+    load_dmem(core.ext_dmem, snapshot["dmem"])
+    core.myRF.registers[:] = snapshot["registers"]
+    core.halted = snapshot["halted"]
+    core.state = State()
+    core.nextState = State()
+    if snapshot["kind"] == kind:
+        for stage in STAGES:
+            load_latch(getattr(core.state, stage), snapshot["state"][stage], core)
+        core.cycle = snapshot["cycle"]
+        if core.counters is not None and "counters" in snapshot:
+            for name, value in snapshot["counters"].items():
+                setattr(core.counters, name, value)
+        if isinstance(core, FiveStageCore):
+            core.pending_stall = snapshot.get("pending_stall")
+    else:
+        # architectural state only - empty pipeline fetching from the saved PC, counts start over
+        core.state.nop_init()
+        core.state.IF.PC = snapshot["pc"]
+        core.cycle = 0
+    core.nextState.copy_from(core.state)
+
+
+def compatible(core, snapshot: dict) -> bool:
+    kind = KINDS[type(core)]
+    return snapshot["kind"] == kind or snapshot["kind"] != "FS" or pipeline_empty(snapshot)
+
+
+def restore_any(core, paths) -> str:
+    # Restore the first snapshot of the core's own kind among paths, else the first one it can take. Snapshots taken
+    # after HALT are skipped.
+    # Returns the path restored from.
+    snapshots = []
+    for path in paths:
+        with open(path) as file:
+            snapshots.append((path, json.load(file)))
+    kind = KINDS[type(core)]
+    halted = [path for path, snapshot in snapshots if snapshot["halted"]]
+    snapshots = [item for item in snapshots if not item[1]["halted"]]
+    candidates = [item for item in snapshots if item[1]["kind"] == kind] + \
+                 [item for item in snapshots if item[1]["kind"] != kind and compatible(core, item[1])]
+    if not candidates:
+        reason = f" ({', '.join(halted)} taken after HALT)" if halted else ""
+        raise Exception(f"No checkpoint among {', '.join(paths)} can be restored into a {kind} core{reason}")
+    path, snapshot = candidates[0]
+    restore_checkpoint(core, snapshot)
+    return path
+
+
+def save_checkpoint(core, path: str):
+    with open(path, "w") as file:
+        json.dump(take_checkpoint(core), file, separators=(",", ":"))
+        file.write("\n")
+
+
+def load_checkpoint(core, path: str):
+    with open(path) as file:
+        restore_checkpoint(core, json.load(file))
+
+
+class CheckpointSchedule(object):
+    # Cycles and instruction counts at which a running core saves a checkpoint. after_step() is called once the
+    # core finished a cycle (the functional engine runs up to the next instruction count instead) and writes
+    # <prefix>checkpoint_c<cycle>.json / <prefix>checkpoint_i<instructions>.json for every point reached.
+
+    def __init__(self, prefix: str, cycles=(), instructions=()):
+        self.prefix = prefix
+        self.cycles = sorted(cycles)
+        self.instructions = sorted(instructions)
+        self.saved = []  # paths written so far
+
+    def __bool__(self):
+        return bool(self.cycles or self.instructions)
+
+    def save(self, core, path: str):
+        save_checkpoint(core, path)
+        self.saved.append(path)
+
+    def after_step(self, core):
+        while self.cycles and core.cycle >= self.cycles[0]:
+            self.save(core, f"{self.prefix}checkpoint_c{self.cycles.pop(0)}.json")
+        while self.instructions and core.state.IF.instruction_count >= self.instructions[0]:
+            self.save(core, f"{self.prefix}checkpoint_i{self.instructions.pop(0)}.json")
+
+    def run_functional(self, core: FunctionalCore):
+        # run to completion, stopping at every requested instruction count (cycles are instructions here)
+        points = sorted(set(self.cycles + self.instructions))
+        for point in points:
+            if core.halted:
+                break
+            if point > core.instruction_count:
+                core.run(point - core.instruction_count)
+            if core.instruction_count < point:
+                break  # halted before reaching it, like after_step never saving a point the core does not reach
+            if point in self.cycles:
+                self.save(core, f"{self.prefix}checkpoint_c{point}.json")
+            if point in self.instructions:
+                self.save(core, f"{self.prefix}checkpoint_i{point}.json")
+        self.cycles, self.instructions = [], []
+        core.run()
+
+
+def parse_points(spec: str):
+    # "100,2000" -> [100, 2000]
+    try:
+        points = [int(point, 0) for point in spec.split(",") if point.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid checkpoint list: {spec}")
+    if any(point < 0 for point in points):
+        raise ValueError(f"Invalid checkpoint list: {spec}")
+    return points
@@ -0,0 +1,53 @@
+import json
+
+# Pipeline stages after IF - the ones that can hold a bubble (nop latch)
+BUBBLE_STAGES = ("ID", "EX", "MEM", "WB")
+
+# Forwarding paths into the ID stage of the five stage core
+FORWARD_EX_ID = "EX->ID"
+FORWARD_MEM_ID = "MEM->ID"
+
+
+class PerformanceCounters(object):
+    # Cycle level event counters of the five stage core, exported as JSON next to PerformanceMetrics_Result.txt
+
+    def __init__(self):
+        self.cycles = 0
+        self.load_use_stalls = 0  # bubbles inserted in EX for a load-use hazard
+        self.predictor = ""  # name of the branch predictor used by IF
+        self.predictions = {"branch": 0, "jal": 0}  # BEQ / BNE and JAL resolved in ID
+        self.branch_flushes = 0  # mispredicted BEQ / BNE resolved in ID flushing the fetched instruction
+        self.jal_flushes = 0  # mispredicted JAL resolved in ID flushing the fetched instruction
+        self.forwarding = {FORWARD_EX_ID: 0, FORWARD_MEM_ID: 0}  # forwarded operands per path
+        self.bubbles = {stage: 0 for stage in BUBBLE_STAGES}  # cycles each stage held a nop
+        self.retired = {}  # mnemonic -> instructions completed (WB, or ID for branches which end there)
+        self.memory_stalls = 0  # cycles the pipeline was frozen waiting for the I-cache / D-cache
+        self.caches = {}  # "icache" / "dcache" -> cache.Cache, only the enabled ones
+
+    def forward(self, path: str):
+        self.forwarding[path] += 1
+
+    def retire(self, mnemonic: str):
+        self.retired[mnemonic] = self.retired.get(mnemonic, 0) + 1
+
+    def as_dict(self) -> dict:
+        return {
+            "cycles": self.cycles,
+            "instructions_retired": sum(self.retired.values()),
+            "load_use_stalls": self.load_use_stalls,
+            "branch_flushes": self.branch_flushes,
+            "jal_flushes": self.jal_flushes,
+            "predictor": self.predictor,
+            "predictions": dict(self.predictions),
+            "mispredictions": {"branch": self.branch_flushes, "jal": self.jal_flushes},
+            "forwarding": dict(self.forwarding),
+            "bubbles": dict(self.bubbles),
+            "retired": dict(sorted(self.retired.items())),
+            "memory_stalls": self.memory_stalls,
+            "caches": {name: cache.as_dict() for name, cache in self.caches.items()},
+        }
+
+    def write_json(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.as_dict(), file, indent=2)
+            file.write("\n")
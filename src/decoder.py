@@ -0,0 +1,105 @@
+from typing import NamedTuple
+
+# Table driven decoder of the RV32I subset the simulator implements (the classes of instructions.py), replacing
+# riscvmodel on the startup path. Words outside the subset - HALT (all ones) included - raise MachineDecodeError
+# carrying the word, like riscvmodel did for undecodable words.
+
+OPCODE_R = 0b0110011
+OPCODE_I = 0b0010011
+OPCODE_LOAD = 0b0000011
+OPCODE_STORE = 0b0100011
+OPCODE_BRANCH = 0b1100011
+OPCODE_JAL = 0b1101111
+
+# opcode -> instruction format
+FORMATS = {
+    OPCODE_R: "R",
+    OPCODE_I: "I",
+    OPCODE_LOAD: "I",
+    OPCODE_STORE: "S",
+    OPCODE_BRANCH: "B",
+    OPCODE_JAL: "J",
+}
+
+# (opcode, funct3, funct7) -> mnemonic, funct3 / funct7 are None where the format has none. Loads with funct3 000
+# (LB in RV32I, the LW encoding of encoding.json) and 010 are both LW - the simulator only has word loads.
+MNEMONICS = {
+    (OPCODE_R, 0b000, 0b0000000): "add",
+    (OPCODE_R, 0b000, 0b0100000): "sub",
+    (OPCODE_R, 0b100, 0b0000000): "xor",
+    (OPCODE_R, 0b110, 0b0000000): "or",
+    (OPCODE_R, 0b111, 0b0000000): "and",
+    (OPCODE_I, 0b000, None): "addi",
+    (OPCODE_I, 0b100, None): "xori",
+    (OPCODE_I, 0b110, None): "ori",
+    (OPCODE_I, 0b111, None): "andi",
+    (OPCODE_LOAD, 0b000, None): "lw",
+    (OPCODE_LOAD, 0b010, None): "lw",
+    (OPCODE_STORE, 0b010, None): "sw",
+    (OPCODE_BRANCH, 0b000, None): "beq",
+    (OPCODE_BRANCH, 0b001, None): "bne",
+    (OPCODE_JAL, None, None): "jal",
+}
+
+
+class MachineDecodeError(Exception):
+    def __init__(self, word: int):
+        super().__init__(f"Invalid instruction word: {word:#010x}")
+        self.word = word
+
+
+class DecodedFields(NamedTuple):
+    mnemonic: str
+    rd: int = 0
+    rs1: int = 0
+    rs2: int = 0
+    imm: int = 0
+
+
+def sign_extend(value: int, bits: int) -> int:
+    # two's complement value of the low `bits` bits
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
+
+
+def imm_i(word: int) -> int:
+    return sign_extend(word >> 20, 12)
+
+
+def imm_s(word: int) -> int:
+    return sign_extend(((word >> 25) << 5) | ((word >> 7) & 0x1f), 12)
+
+
+def imm_b(word: int) -> int:
+    return sign_extend(((word >> 31) << 12) | (((word >> 7) & 1) << 11) | (((word >> 25) & 0x3f) << 5) |
+                       (((word >> 8) & 0xf) << 1), 13)
+
+
+def imm_j(word: int) -> int:
+    return sign_extend(((word >> 31) << 20) | (((word >> 12) & 0xff) << 12) | (((word >> 20) & 1) << 11) |
+                       (((word >> 21) & 0x3ff) << 1), 21)
+
+
+def decode(word: int) -> DecodedFields:
+    opcode = word & 0x7f
+    form = FORMATS.get(opcode)
+    mnemonic = None
+    if form is not None:
+        funct3 = (word >> 12) & 0x7 if form != "J" else None
+        funct7 = word >> 25 if form == "R" else None
+        mnemonic = MNEMONICS.get((opcode, funct3, funct7))
+    if mnemonic is None:
+        raise MachineDecodeError(word)
+
+    rd = (word >> 7) & 0x1f
+    rs1 = (word >> 15) & 0x1f
+    rs2 = (word >> 20) & 0x1f
+    if form == "R":
+        return DecodedFields(mnemonic, rd, rs1, rs2)
+    if form == "I":
+        return DecodedFields(mnemonic, rd, rs1, imm=imm_i(word))
+    if form == "S":
+        return DecodedFields(mnemonic, rs1=rs1, rs2=rs2, imm=imm_s(word))
+    if form == "B":
+        return DecodedFields(mnemonic, rs1=rs1, rs2=rs2, imm=imm_b(word))
+    return DecodedFields(mnemonic, rd, imm=imm_j(word))
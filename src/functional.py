@@ -0,0 +1,154 @@
+from models import InsMem, DataMem, DecodedInstruction
+from predecode import DecodedProgram, predecode
+
+# Fast functional engine - executes the RV32I subset of instructions.py (ADD/SUB/XOR/OR/AND, ADDI/XORI/ORI/ANDI,
+# LW/SW, BEQ/BNE, JAL, HALT) one instruction per iteration of a single loop over predecoded integer tuples and a
+# plain int register list. No pipeline State, no instruction objects. Register values follow the cores in rv32i.py
+# exactly (including the unmasked Python int arithmetic) so the engine can serve as golden reference for them
+# and to fast-forward a program before detailed simulation.
+
+OP_ADD, OP_SUB, OP_XOR, OP_OR, OP_AND, OP_ADDI, OP_XORI, OP_ORI, OP_ANDI, OP_LW, OP_SW, OP_BEQ, OP_BNE, OP_JAL, \
+    OP_HALT, OP_INVALID, OP_UNSUPPORTED = range(17)
+
+OPCODES = {
+    "add": OP_ADD,
+    "sub": OP_SUB,
+    "xor": OP_XOR,
+    "or": OP_OR,
+    "and": OP_AND,
+    "addi": OP_ADDI,
+    "xori": OP_XORI,
+    "ori": OP_ORI,
+    "andi": OP_ANDI,
+    "lw": OP_LW,
+    "sw": OP_SW,
+    "beq": OP_BEQ,
+    "bne": OP_BNE,
+    "jal": OP_JAL,
+    "halt": OP_HALT,
+    "invalid": OP_INVALID,
+}
+
+
+def compile_instruction(instruction: DecodedInstruction) -> tuple:
+    # (opcode, rd, rs1, rs2, imm) tuple executed by FunctionalCore.run
+    if instruction.handler is None and instruction.mnemonic not in ("halt", "invalid"):
+        op = OP_UNSUPPORTED
+    else:
+        op = OPCODES.get(instruction.mnemonic, OP_UNSUPPORTED)
+    return op, instruction.rd, instruction.rs1, instruction.rs2, instruction.imm
+
+
+def compile_program(program: DecodedProgram) -> list:
+    # one tuple per instruction word, indexed by pc >> 2
+    return [compile_instruction(program.fetch(address)) for address in range(0, len(program.table) * 4, 4)]
+
+
+class FunctionalCore(object):
+    def __init__(self, imem: InsMem, dmem: DataMem):
+        self.program = predecode(imem)
+        self.code = compile_program(self.program)
+        self.dmem = dmem
+        self.registers = [0x0 for _ in range(32)]
+        self.pc = 0
+        # counted like SingleStageCore: every executed instruction plus the HALT
+        self.instruction_count = 0
+        self.halted = False
+
+    def run(self, max_instructions=None) -> int:
+        # Execute until HALT or until max_instructions instructions were executed, return the number executed
+        code = self.code
+        size = len(code)
+        regs = self.registers
+        read_data = self.dmem.read_data
+        write_data = self.dmem.write_data_mem
+        pc = self.pc
+        limit = max_instructions if max_instructions is not None else -1
+        executed = 0
+
+        try:
+            while executed != limit and not self.halted:
+                if pc < 0 or pc >= size << 2:
+                    raise Exception("Instruction MEM - Out of bound access")
+                op, rd, rs1, rs2, imm = code[pc >> 2]
+                # opcodes ordered roughly by dynamic frequency
+                if op == OP_ADDI:
+                    if rd:
+                        regs[rd] = regs[rs1] + imm
+                elif op == OP_ADD:
+                    if rd:
+                        regs[rd] = regs[rs1] + regs[rs2]
+                elif op == OP_LW:
+                    if rd:
+                        regs[rd] = read_data(regs[rs1] + imm)
+                    else:
+                        read_data(regs[rs1] + imm)
+                elif op == OP_SW:
+                    write_data(regs[rs1] + imm, regs[rs2])
+                elif op == OP_BNE:
+                    if regs[rs1] != regs[rs2]:
+                        pc += imm
+                        executed += 1
+                        continue
+                elif op == OP_BEQ:
+                    if regs[rs1] == regs[rs2]:
+                        pc += imm
+                        executed += 1
+                        continue
+                elif op == OP_JAL:
+                    if rd:
+                        regs[rd] = pc + 4
+                    pc += imm
+                    executed += 1
+                    continue
+                elif op == OP_SUB:
+                    if rd:
+                        regs[rd] = regs[rs1] - regs[rs2]
+                elif op == OP_XOR:
+                    if rd:
+                        regs[rd] = regs[rs1] ^ regs[rs2]
+                elif op == OP_OR:
+                    if rd:
+                        regs[rd] = regs[rs1] | regs[rs2]
+                elif op == OP_AND:
+                    if rd:
+                        regs[rd] = regs[rs1] & regs[rs2]
+                elif op == OP_XORI:
+                    if rd:
+                        regs[rd] = regs[rs1] ^ imm
+                elif op == OP_ORI:
+                    if rd:
+                        regs[rd] = regs[rs1] | imm
+                elif op == OP_ANDI:
+                    if rd:
+                        regs[rd] = regs[rs1] & imm
+                elif op == OP_HALT:
+                    self.halted = True
+                    executed += 1
+                    break
+                elif op == OP_INVALID:
+                    raise Exception("Invalid Instruction to Decode")
+                else:
+                    raise Exception("Invalid Instruction")
+                pc += 4
+                executed += 1
+        finally:
+            self.pc = pc
+            self.instruction_count += executed
+        return executed
+
+    def output_rf(self, output_file: str):
+        # Final register state in the *_RFResult.txt format. Labelled with the cycle SingleStageCore halts
+        # in so the file matches the last block of SS_RFResult.txt
+        op = ["State of RF after executing cycle:\t" + str(self.instruction_count) + "\n"]
+        op.extend(['{:032b}'.format(val & 0xffffffff) + "\n" for val in self.registers])
+        with open(output_file, "w") as file:
+            file.writelines(op)
+
+    def report(self) -> dict:
+        return {
+            "instruction_count": self.instruction_count,
+            "pc": self.pc,
+            "halted": self.halted,
+            "registers": list(self.registers),
+        }
@@ -3,15 +3,14 @@ import importlib
 import os
 from abc import ABC
 
-from riscvmodel.code import decode
-from riscvmodel.isa import Instruction
-
-from models import DataMem, RegisterFile, State, EXState, WBState, MEMState
+from branch_predictor import BranchPredictor
+from counters import PerformanceCounters, FORWARD_EX_ID, FORWARD_MEM_ID
+from models import DataMem, RegisterFile, State, DecodedInstruction
 
 
 class InstructionBase(metaclass=abc.ABCMeta):
 
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         self.instruction = instruction
         self.memory = memory
@@ -19,6 +18,8 @@ class InstructionBase(metaclass=abc.ABCMeta):
         self.state = state
         self.nextState = nextState
         self.stages = self.memory.id
+        self.counters: PerformanceCounters = None  # five stage core event counters, set by decode()
+        self.predictor: BranchPredictor = None  # five stage core branch predictor, set by decode()
 
     def decode_ss(self, *args, **kwargs):
         pass
@@ -42,7 +43,7 @@ class InstructionBase(metaclass=abc.ABCMeta):
         pass
 
     def mem_fs(self, *args, **kwargs):
-        wb_state = WBState()
+        wb_state = self.nextState.reset_latch("WB")
         # For ALU instructions, store_data = alu_result
         # For LOAD instructions, store_data = loaded data (set by subclass)
         # For STORE instructions, store_data = 0 (nothing to write back)
@@ -57,12 +58,43 @@ class InstructionBase(metaclass=abc.ABCMeta):
             write_back_enable=self.state.MEM.write_back_enable,
             halt=self.state.MEM.halt
         )
-        self.nextState.WB = wb_state
 
     def wb_fs(self, *args, **kwargs):
         if self.state.WB.write_back_enable:
             self.registers.write_rf(self.state.WB.write_register_addr, self.state.WB.store_data)
 
+    def flush_fs(self, next_pc: int):
+        # Redirect fetch to next_pc and flush the speculatively fetched instruction
+        self.nextState.IF.PC = next_pc
+        id_state = self.nextState.reset_latch("ID")
+        id_state.nop = True
+        id_state.instruction_bytes = self.state.ID.instruction_bytes
+        id_state.PC = self.state.ID.PC
+
+    def resolve_fs(self, conditional: bool, taken: bool) -> bool:
+        # Compare the outcome of the branch / jump resolved in ID with the prediction IF made for it,
+        # train the predictor and return True on a misprediction - the fetched instruction must be flushed
+        pc = self.state.ID.PC
+        target = pc + self.imm
+        if self.predictor is not None:
+            self.predictor.resolve(pc, conditional, taken, target)
+        if self.counters is not None:
+            self.counters.predictions["branch" if conditional else "jal"] += 1
+        if taken:
+            return not self.state.ID.predicted_taken or self.state.ID.predicted_target != target
+        return self.state.ID.predicted_taken
+
+    def count_forward(self, path: str):
+        # bubbles (nop ID latch, e.g. the copy decoded again while HALT drains) forward nothing
+        if self.counters is not None and not self.state.ID.nop:
+            self.counters.forward(path)
+
+    def count_forwards(self, *paths):
+        # count the path each operand was finally forwarded from, None for an operand read from the register file
+        for path in paths:
+            if path is not None:
+                self.count_forward(path)
+
     def decode(self, *args, **kwargs):
         if self.stages == "SS":
             return self.decode_ss(*args, **kwargs)
@@ -71,6 +103,8 @@ class InstructionBase(metaclass=abc.ABCMeta):
             self.nextState = kwargs["nextState"]
             self.memory = kwargs["memory"]
             self.registers = kwargs["registers"]
+            self.counters = kwargs.get("counters")
+            self.predictor = kwargs.get("predictor")
             return self.state, self.nextState, self.memory, self.registers, self.decode_fs(*args, **kwargs)
 
     def execute(self, *args, **kwargs):
@@ -108,7 +142,7 @@ class InstructionBase(metaclass=abc.ABCMeta):
 
 
 class InstructionRBase(InstructionBase, ABC):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(InstructionRBase, self).__init__(instruction, memory, registers, state, nextState)
         self.rs1 = instruction.rs1
@@ -120,7 +154,7 @@ class InstructionRBase(InstructionBase, ABC):
         return self.registers.write_rf(self.rd, data)
 
     def decode_fs(self, *args, **kwargs):
-        ex_state = EXState()
+        ex_state = self.nextState.reset_latch("EX")
 
         # TODO: Handle Hazards
         #   set nop for EX state
@@ -144,7 +178,7 @@ class InstructionRBase(InstructionBase, ABC):
         if self.state.EX.destination_register in [self.rs1,
                                                   self.rs2] and self.state.EX.read_data_mem and self.rs1 != 0 and self.rs2 != 0:
             # Create a clean NOP state
-            ex_state = EXState()
+            ex_state = self.nextState.reset_latch("EX")
             ex_state.set_attributes(
                 nop=True,
                 instr_binary=self.state.ID.instruction_bytes,  # Keep instruction for debugging
@@ -159,37 +193,44 @@ class InstructionRBase(InstructionBase, ABC):
                 write_data_mem=False,
                 write_back_enable=False
             )
-            self.state.IF.PC -= 4
-            self.nextState.EX = ex_state
+            self.state.IF.PC = self.state.ID.PC  # fetch the stalled instruction again
             self.nextState.IF.instruction_count = self.nextState.IF.instruction_count - 1
+            if self.counters is not None:
+                self.counters.load_use_stalls += 1
             return
 
-        # Forwarding
+        # Forwarding - the last matching path provides the operand and is the one counted
+        forwarded1 = forwarded2 = None
         # MEM-to-ID forwarding for LOAD instructions
         if self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs1 and self.rs1 != 0:
             ex_state.operand1 = self.nextState.WB.store_data
+            forwarded1 = FORWARD_MEM_ID
 
         if self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs2 and self.rs2 != 0:
             ex_state.operand2 = self.nextState.WB.store_data
+            forwarded2 = FORWARD_MEM_ID
 
         # MEM-to-ID forwarding for ALU instructions
         if not self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs1 and self.rs1 != 0:
             ex_state.operand1 = self.nextState.WB.store_data
+            forwarded1 = FORWARD_MEM_ID
 
         if not self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs2 and self.rs2 != 0:
             ex_state.operand2 = self.nextState.WB.store_data
+            forwarded2 = FORWARD_MEM_ID
 
         # EX-to-ID forwarding for ALU instructions
         if not self.state.EX.read_data_mem and self.state.EX.write_back_enable and not self.state.EX.write_data_mem and self.state.EX.destination_register == self.rs1 and self.rs1 != 0:
             ex_state.operand1 = self.nextState.MEM.alu_result
+            forwarded1 = FORWARD_EX_ID
 
         if not self.state.EX.read_data_mem and self.state.EX.write_back_enable and not self.state.EX.write_data_mem and self.state.EX.destination_register == self.rs2 and self.rs2 != 0:
             ex_state.operand2 = self.nextState.MEM.alu_result
-
-        self.nextState.EX = ex_state
+            forwarded2 = FORWARD_EX_ID
+        self.count_forwards(forwarded1, forwarded2)
 
     def execute_fs(self, *args, **kwargs):
-        mem_state = MEMState()
+        mem_state = self.nextState.reset_latch("MEM")
         mem_state.set_attributes(
             instruction_ob=self,
             nop=self.state.EX.nop,
@@ -200,23 +241,22 @@ class InstructionRBase(InstructionBase, ABC):
             write_back_enable=True,
             halt=self.state.EX.halt
         )
-        self.nextState.MEM = mem_state
 
 
 class InstructionIBase(InstructionBase, ABC):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(InstructionIBase, self).__init__(instruction, memory, registers, state, nextState)
         self.rs1 = instruction.rs1
         self.rd = instruction.rd
-        self.imm = instruction.imm.value
+        self.imm = instruction.imm
 
     def wb_ss(self, *args, **kwargs):
         data = kwargs['alu_result']
         return self.registers.write_rf(self.rd, data)
 
     def decode_fs(self, *args, **kwargs):
-        ex_state = EXState()
+        ex_state = self.nextState.reset_latch("EX")
         ex_state.set_attributes(
             instruction_ob=self,
             nop=self.state.ID.nop,
@@ -235,7 +275,7 @@ class InstructionIBase(InstructionBase, ABC):
         # Stall - insert NOP bubble
         if self.state.EX.destination_register == self.rs1 and self.state.EX.read_data_mem and self.rs1 != 0:
             # Create a clean NOP state
-            ex_state = EXState()
+            ex_state = self.nextState.reset_latch("EX")
             ex_state.set_attributes(
                 nop=True,
                 instr_binary=self.state.ID.instruction_bytes,  # Keep instruction for debugging
@@ -250,28 +290,32 @@ class InstructionIBase(InstructionBase, ABC):
                 write_data_mem=False,
                 write_back_enable=False
             )
-            self.state.IF.PC -= 4
-            self.nextState.EX = ex_state
+            self.state.IF.PC = self.state.ID.PC  # fetch the stalled instruction again
             self.nextState.IF.instruction_count = self.nextState.IF.instruction_count - 1
+            if self.counters is not None:
+                self.counters.load_use_stalls += 1
             return
 
-        # Forwarding
+        # Forwarding - the last matching path provides the operand and is the one counted
+        forwarded1 = None
         # MEM-to-ID forwarding for LOAD instructions
         if self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs1 and self.rs1 != 0:
             ex_state.operand1 = self.nextState.WB.store_data
+            forwarded1 = FORWARD_MEM_ID
 
         # MEM-to-ID forwarding for ALU instructions
         if not self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs1 and self.rs1 != 0:
             ex_state.operand1 = self.nextState.WB.store_data
+            forwarded1 = FORWARD_MEM_ID
 
         # EX-to-ID forwarding for ALU instructions
         if not self.state.EX.read_data_mem and self.state.EX.write_back_enable and not self.state.EX.write_data_mem and self.state.EX.destination_register == self.rs1 and self.rs1 != 0:
             ex_state.operand1 = self.nextState.MEM.alu_result
-
-        self.nextState.EX = ex_state
+            forwarded1 = FORWARD_EX_ID
+        self.count_forwards(forwarded1)
 
     def execute_fs(self, *args, **kwargs):
-        mem_state = MEMState()
+        mem_state = self.nextState.reset_latch("MEM")
         mem_state.set_attributes(
             instruction_ob=self,
             nop=self.state.EX.nop,
@@ -282,16 +326,15 @@ class InstructionIBase(InstructionBase, ABC):
             write_back_enable=True,
             halt=self.state.EX.halt
         )
-        self.nextState.MEM = mem_state
 
 
 class InstructionSBase(InstructionBase, ABC):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(InstructionSBase, self).__init__(instruction, memory, registers, state, nextState)
         self.rs1 = instruction.rs1
         self.rs2 = instruction.rs2
-        self.imm = instruction.imm.value
+        self.imm = instruction.imm
 
     def mem_ss(self, *args, **kwargs):
         address = kwargs['alu_result']
@@ -299,7 +342,7 @@ class InstructionSBase(InstructionBase, ABC):
         self.memory.write_data_mem(address, data)
 
     def decode_fs(self, *args, **kwargs):
-        ex_state = EXState()
+        ex_state = self.nextState.reset_latch("EX")
         ex_state.set_attributes(
             instruction_ob=self,
             nop=self.state.ID.nop,
@@ -320,7 +363,7 @@ class InstructionSBase(InstructionBase, ABC):
         if self.state.EX.destination_register in [self.rs1,
                                                   self.rs2] and self.state.EX.read_data_mem and self.rs1 != 0 and self.rs2 != 0:
             # Create a clean NOP state
-            ex_state = EXState()
+            ex_state = self.nextState.reset_latch("EX")
             ex_state.set_attributes(
                 nop=True,
                 instr_binary=self.state.ID.instruction_bytes,  # Keep instruction for debugging
@@ -335,40 +378,47 @@ class InstructionSBase(InstructionBase, ABC):
                 write_data_mem=False,
                 write_back_enable=False
             )
-            self.state.IF.PC -= 4
-            self.nextState.EX = ex_state
+            self.state.IF.PC = self.state.ID.PC  # fetch the stalled instruction again
             self.nextState.IF.instruction_count = self.nextState.IF.instruction_count - 1
+            if self.counters is not None:
+                self.counters.load_use_stalls += 1
             return
 
-        # Forwarding
+        # Forwarding - the last matching path provides the operand and is the one counted
+        forwarded1 = forwarded2 = None
         # EX-to-ID forwarding for ALU instructions
         if not self.state.EX.read_data_mem and self.state.EX.write_back_enable and not self.state.EX.write_data_mem and self.state.EX.destination_register == self.rs1 and self.rs1 != 0:
             ex_state.operand1 = self.nextState.MEM.alu_result
+            forwarded1 = FORWARD_EX_ID
 
         if not self.state.EX.read_data_mem and self.state.EX.write_back_enable and not self.state.EX.write_data_mem and self.state.EX.destination_register == self.rs2 and self.rs2 != 0:
             ex_state.store_data = self.nextState.MEM.alu_result
             ex_state.operand2 = self.nextState.MEM.alu_result
+            forwarded2 = FORWARD_EX_ID
 
         # MEM-to-ID forwarding for LOAD instructions
         if self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs1 and self.rs1 != 0:
             ex_state.operand1 = self.nextState.WB.store_data
+            forwarded1 = FORWARD_MEM_ID
 
         if self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs2 and self.rs2 != 0:
             ex_state.store_data = self.nextState.WB.store_data
             ex_state.operand2 = self.nextState.WB.store_data
+            forwarded2 = FORWARD_MEM_ID
 
         # MEM-to-ID forwarding for ALU instructions
         if not self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs1 and self.rs1 != 0:
             ex_state.operand1 = self.nextState.WB.store_data
+            forwarded1 = FORWARD_MEM_ID
 
         if not self.state.MEM.read_data_mem and self.state.MEM.write_back_enable and not self.state.MEM.write_data_mem and self.state.MEM.write_register_addr == self.rs2 and self.rs2 != 0:
             ex_state.store_data = self.nextState.WB.store_data
             ex_state.operand2 = self.nextState.WB.store_data
-
-        self.nextState.EX = ex_state
+            forwarded2 = FORWARD_MEM_ID
+        self.count_forwards(forwarded1, forwarded2)
 
     def execute_fs(self, *args, **kwargs):
-        mem_state = MEMState()
+        mem_state = self.nextState.reset_latch("MEM")
         address = self.state.EX.operand1 + self.state.EX.imm  # FIXED: Use imm instead of operand2
         mem_state.set_attributes(
             instruction_ob=self,
@@ -381,27 +431,25 @@ class InstructionSBase(InstructionBase, ABC):
             write_data_mem=True,
             halt=self.state.ID.halt
         )
-        self.nextState.MEM = mem_state
 
     def mem_fs(self, *args, **kwargs):
         if self.state.MEM.write_data_mem:
             self.memory.write_data_mem(self.state.MEM.data_address, self.state.MEM.store_data)
-        wb_state = WBState()
+        wb_state = self.nextState.reset_latch("WB")
         wb_state.set_attributes(
             instruction_ob=self,
             rs1=self.state.MEM.rs1,  # ADD: Propagate rs1 from MEM to WB
             rs2=self.state.MEM.rs2   # ADD: Propagate rs2 from MEM to WB
         )
-        self.nextState.WB = wb_state
 
 
 class InstructionBBase(InstructionBase, ABC):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(InstructionBBase, self).__init__(instruction, memory, registers, state, nextState)
         self.rs1 = instruction.rs1
         self.rs2 = instruction.rs2
-        self.imm = instruction.imm.value
+        self.imm = instruction.imm
 
     @abc.abstractmethod
     def take_branch(self, operand1, operand2):
@@ -411,13 +459,12 @@ class InstructionBBase(InstructionBase, ABC):
         pass
 
     def execute_fs(self, *args, **kwargs):
-        mem_state = MEMState()
+        mem_state = self.nextState.reset_latch("MEM")
         mem_state.instruction_ob = self
         mem_state.rs1 = self.state.EX.rs1  # ADD: Propagate rs1 from EX to MEM
         mem_state.rs2 = self.state.EX.rs2  # ADD: Propagate rs2 from EX to MEM
         mem_state.alu_result = 0  # ADD: Branches don't have ALU result
         mem_state.nop = True
-        self.nextState.MEM = mem_state
 
     def decode_fs(self, *args, **kwargs):
 
@@ -426,19 +473,23 @@ class InstructionBBase(InstructionBase, ABC):
 
         if self.state.EX.write_back_enable and self.state.EX.destination_register != 0 and self.state.EX.destination_register == self.rs1 and self.rs1 != 0:
             operand1 = self.nextState.MEM.alu_result
+            self.count_forward(FORWARD_EX_ID)
 
         if self.state.EX.write_back_enable and self.state.EX.destination_register != 0 and self.state.EX.destination_register == self.rs2 and self.rs2 != 0:
             operand2 = self.nextState.MEM.alu_result
+            self.count_forward(FORWARD_EX_ID)
 
         if self.state.MEM.write_back_enable and self.state.MEM.write_register_addr != 0 and not (
                 self.state.EX.write_back_enable and self.state.EX.destination_register != 0 and self.state.EX.destination_register == self.rs1) and self.state.MEM.write_register_addr == self.rs1 and self.rs1 != 0:
             operand1 = self.nextState.WB.store_data
+            self.count_forward(FORWARD_MEM_ID)
 
         if self.state.MEM.write_back_enable and self.state.MEM.write_register_addr != 0 and not (
                 self.state.EX.write_back_enable and self.state.EX.destination_register != 0 and self.state.EX.destination_register == self.rs2) and self.state.MEM.write_register_addr == self.rs2 and self.rs2 != 0:
             operand2 = self.nextState.WB.store_data
+            self.count_forward(FORWARD_MEM_ID)
 
-        ex_state = EXState()
+        ex_state = self.nextState.reset_latch("EX")
         ex_state.instruction_ob = self
         ex_state.instr_binary = self.state.ID.instruction_bytes  # ADD: Binary instruction string
         ex_state.operand1 = operand1  # ADD: Set operand1 value
@@ -448,35 +499,40 @@ class InstructionBBase(InstructionBase, ABC):
         ex_state.imm = self.imm  # ADD: B-type instructions have immediates
         ex_state.is_i_type = 0  # FIX: B-type instructions should have is_I_type = 0, not 1
 
-        if self.take_branch(operand1, operand2):
-            self.nextState.IF.PC = self.state.IF.PC + self.imm - 4
-            # Flush the speculatively fetched instruction
-            from models import IDState
-            id_state = IDState()
-            id_state.nop = True
-            id_state.instruction_bytes = self.state.ID.instruction_bytes
-            self.nextState.ID = id_state
+        taken = self.take_branch(operand1, operand2)
+        if self.state.ID.nop:
+            # flushed copy of the branch resolved in the previous cycle - its redirect is overwritten by IF
+            # unless IF already halted
+            if taken:
+                self.flush_fs(self.state.IF.PC + self.imm - 4)
+        else:
+            mispredicted = self.resolve_fs(True, taken)
+            if self.counters is not None:
+                # branches complete in ID
+                self.counters.retire(self.instruction.mnemonic)
+                if mispredicted:
+                    self.counters.branch_flushes += 1
+            if mispredicted:
+                self.flush_fs(self.state.ID.PC + (self.imm if taken else 4))
         ex_state.nop = True
 
-        self.nextState.EX = ex_state
-
 
 class InstructionJBase(InstructionBase, ABC):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(InstructionJBase, self).__init__(instruction, memory, registers, state, nextState)
         self.rd = instruction.rd
-        self.imm = instruction.imm.value
+        self.imm = instruction.imm
 
     def execute_ss(self, *args, **kwargs):
         pass
 
     def decode_fs(self, *args, **kwargs):
-        ex_state = EXState()
+        ex_state = self.nextState.reset_latch("EX")
         ex_state.set_attributes(
             instruction_ob=self,
             instr_binary=self.state.ID.instruction_bytes,  # ADD: Binary instruction string
-            store_data=self.state.IF.PC,
+            store_data=self.state.ID.PC + 4,
             destination_register=self.rd,
             rs1=0,  # ADD: JAL doesn't use source registers
             rs2=0,  # ADD: JAL doesn't use source registers
@@ -485,18 +541,16 @@ class InstructionJBase(InstructionBase, ABC):
             write_back_enable=True
         )
 
-        self.nextState.IF.PC = self.state.IF.PC + self.imm - 4
-        # Flush the speculatively fetched instruction
-        from models import IDState
-        id_state = IDState()
-        id_state.nop = True
-        id_state.instruction_bytes = self.state.ID.instruction_bytes
-        self.nextState.ID = id_state
-
-        self.nextState.EX = ex_state
+        if self.state.ID.nop:
+            # flushed copy of the JAL resolved in the previous cycle, see InstructionBBase.decode_fs
+            self.flush_fs(self.state.IF.PC + self.imm - 4)
+        elif self.resolve_fs(False, True):
+            self.flush_fs(self.state.ID.PC + self.imm)
+            if self.counters is not None:
+                self.counters.jal_flushes += 1
 
     def execute_fs(self, *args, **kwargs):
-        mem_state = MEMState()
+        mem_state = self.nextState.reset_latch("MEM")
         mem_state.set_attributes(
             instruction_ob=self,
             store_data=self.state.EX.store_data,
@@ -506,11 +560,10 @@ class InstructionJBase(InstructionBase, ABC):
             rs2=self.state.EX.rs2,  # ADD: Propagate rs2 from EX to MEM
             write_back_enable=True
         )
-        self.nextState.MEM = mem_state
 
 
 class ADD(InstructionRBase):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(ADD, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -526,7 +579,7 @@ class ADD(InstructionRBase):
 
 class SUB(InstructionRBase):
 
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(SUB, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -541,7 +594,7 @@ class SUB(InstructionRBase):
 
 class XOR(InstructionRBase):
 
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(XOR, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -556,7 +609,7 @@ class XOR(InstructionRBase):
 
 class OR(InstructionRBase):
 
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(OR, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -570,7 +623,7 @@ class OR(InstructionRBase):
 
 
 class AND(InstructionRBase):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(AND, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -584,7 +637,7 @@ class AND(InstructionRBase):
 
 
 class ADDI(InstructionIBase):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(ADDI, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -598,7 +651,7 @@ class ADDI(InstructionIBase):
 
 
 class XORI(InstructionIBase):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(XORI, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -613,7 +666,7 @@ class XORI(InstructionIBase):
 
 class ORI(InstructionIBase):
 
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(ORI, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -627,7 +680,7 @@ class ORI(InstructionIBase):
 
 
 class ANDI(InstructionIBase):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(ANDI, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -641,7 +694,7 @@ class ANDI(InstructionIBase):
 
 
 class LW(InstructionIBase):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(LW, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -678,7 +731,7 @@ class LW(InstructionIBase):
 
 
 class SW(InstructionSBase):
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(SW, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -688,7 +741,7 @@ class SW(InstructionSBase):
 
 class BEQ(InstructionBBase):
 
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(BEQ, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -698,7 +751,7 @@ class BEQ(InstructionBBase):
 
 class BNE(InstructionBBase):
 
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(BNE, self).__init__(instruction, memory, registers, state, nextState)
 
@@ -708,19 +761,19 @@ class BNE(InstructionBBase):
 
 class JAL(InstructionJBase):
 
-    def __init__(self, instruction: Instruction, memory: DataMem, registers: RegisterFile, state: State,
+    def __init__(self, instruction: DecodedInstruction, memory: DataMem, registers: RegisterFile, state: State,
                  nextState: State):
         super(JAL, self).__init__(instruction, memory, registers, state, nextState)
 
 
 class ADDERBTYPE:
-    def __init__(self, instruction: Instruction, state: State(), registers: RegisterFile):
+    def __init__(self, instruction: DecodedInstruction, state: State(), registers: RegisterFile):
         self.instruction = instruction
         self.state = state
         self.registers = registers
         self.rs1 = instruction.rs1
         self.rs2 = instruction.rs2
-        self.imm = instruction.imm.value
+        self.imm = instruction.imm
 
     def get_pc(self, *args, **kwargs):
         if self.instruction.mnemonic == 'beq':
@@ -736,12 +789,12 @@ class ADDERBTYPE:
 
 
 class ADDERJTYPE:
-    def __init__(self, instruction: Instruction, state: State(), registers: RegisterFile):
+    def __init__(self, instruction: DecodedInstruction, state: State(), registers: RegisterFile):
         self.instruction = instruction
         self.state = state
         self.registers = registers
         self.rd = instruction.rd
-        self.imm = instruction.imm.value
+        self.imm = instruction.imm
 
     def get_pc(self, *args, **kwargs):
         self.registers.write_rf(self.rd, self.state.IF.PC + 4)
@@ -759,7 +812,8 @@ def get_instruction_class(mnemonic: str):
 
 
 def main():
-    instruction: Instruction = decode(int("01000100010000100110101110010011", 2))
+    from predecode import decode_word
+    instruction: DecodedInstruction = decode_word(int("01000100010000100110101110010011", 2))
     ioDir = os.path.abspath("./data")
     dmem_ss = DataMem("SS", ioDir)
     registers = RegisterFile(ioDir)
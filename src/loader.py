@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Program / data image loader
+Loads instruction and data memory images into compact byte buffers in the simulator's byte order (most
+significant byte of every 32-bit word first, like imem.txt / dmem.txt). Supported inputs, by file extension:
+
+    .txt   one 8-bit binary string per line, parsed in chunks (imem.txt / dmem.txt)
+    .bin   packed form of the text format, memory mapped copy-on-write
+    .raw   raw little-endian memory image, e.g. objcopy -O binary
+    .hex   Intel HEX of a little-endian memory image, e.g. objcopy -O ihex
+    .elf   ELF32 executable, PT_LOAD segments - executable ones are the program, the others the data
+
+A core's io_dir is searched for imem / dmem with these extensions in that order. Programs from .hex / .elf are
+rebased so they start at address 0 (the cores fetch from PC 0), data keeps its addresses.
+
+    python loader.py INPUT OUTPUT.bin [--data]      convert INPUT to the packed .bin form
+
+Data images packed with --data start at address 0, sparse ones (segments far from address 0) are refused.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+EXTENSIONS = (".txt", ".bin", ".raw", ".hex", ".elf")
+CHUNK_SIZE = 1 << 20  # bytes of text parsed at a time
+MAX_DATA_GAP = 1 << 16  # zero bytes the packed form of a data image may fill in between / before its segments
+
+# ELF constants
+ELF_MAGIC = b"\x7fELF"
+ELFCLASS32 = 1
+ELFDATA2LSB = 1
+PT_LOAD = 1
+PF_X = 1
+
+
+def find_input(io_dir: str, stem: str) -> str:
+    # first existing io_dir/stem.<extension>, the text file name if there is none (opening it reports the error)
+    for extension in EXTENSIONS:
+        path = os.path.join(io_dir, stem + extension)
+        if os.path.exists(path):
+            return path
+    return os.path.join(io_dir, stem + EXTENSIONS[0])
+
+
+def parse_text(chunk: bytes) -> bytes:
+    tokens = chunk.split()
+    if not tokens:
+        return b""
+    if set(map(len, tokens)) == {8}:
+        # base 2 conversion is linear in the number of digits: one int for the whole chunk
+        return int(b"".join(tokens), 2).to_bytes(len(tokens), "big")
+    return bytes(int(token, 2) for token in tokens)
+
+
+def read_text(path: str) -> bytearray:
+    image = bytearray()
+    rest = b""
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            # a line cut by the chunk boundary is parsed with the next chunk
+            end = max(chunk.rfind(b"\n"), chunk.rfind(b"\r")) + 1
+            rest = chunk[end:]
+            image += parse_text(chunk[:end])
+    image += parse_text(rest)
+    return image
+
+
+def map_packed(path: str):
+    # copy-on-write mapping: pages are read on first access and stores (self modifying code) stay private
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return bytearray()
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+
+def swap_words(address: int, data) -> tuple:
+    # (word aligned address, data in the simulator byte order) of little-endian memory contents at address
+    head = address % 4
+    image = bytearray(head) + bytearray(data)
+    image += bytearray(-len(image) % 4)
+    swapped = bytearray(len(image))
+    swapped[0::4], swapped[1::4], swapped[2::4], swapped[3::4] = image[3::4], image[2::4], image[1::4], image[0::4]
+    return address - head, swapped
+
+
+def read_hex(path: str) -> list:
+    # (address, bytes) of every run of consecutive Intel HEX data records
+    segments = []
+    base = 0
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                if line[0] != ":":
+                    raise ValueError("missing ':'")
+                record = bytes.fromhex(line[1:])
+            except ValueError as error:
+                raise ValueError(f"{path}:{number}: invalid Intel HEX record ({error})")
+            if len(record) < 5 or len(record) != record[0] + 5 or sum(record) & 0xff:
+                raise ValueError(f"{path}:{number}: invalid Intel HEX record length or checksum")
+            kind = record[3]
+            payload = record[4:-1]
+            if kind == 0x00:
+                address = base + int.from_bytes(record[1:3], "big")
+                if segments and segments[-1][0] + len(segments[-1][1]) == address:
+                    segments[-1][1].extend(payload)
+                else:
+                    segments.append((address, bytearray(payload)))
+            elif kind == 0x01:
+                break
+            elif kind == 0x02:
+                base = int.from_bytes(payload, "big") << 4
+            elif kind == 0x04:
+                base = int.from_bytes(payload, "big") << 16
+            # 0x03 / 0x05 start addresses: the cores always start at PC 0
+    return segments
+
+
+def read_elf(path: str, executable: bool) -> list:
+    # (address, bytes) of the PT_LOAD segments that are (executable=True) or are not executable
+    with open(path, "rb") as file:
+        image = file.read()
+    if image[:4] != ELF_MAGIC or image[4] != ELFCLASS32:
+        raise ValueError(f"{path}: not an ELF32 file")
+    order = "<" if image[5] == ELFDATA2LSB else ">"
+    e_phoff, = struct.unpack_from(order + "I", image, 28)
+    e_phentsize, e_phnum = struct.unpack_from(order + "HH", image, 42)
+    segments = []
+    for index in range(e_phnum):
+        p_type, p_offset, p_vaddr, _, p_filesz, p_memsz, p_flags, _ = \
+            struct.unpack_from(order + "8I", image, e_phoff + index * e_phentsize)
+        if p_type != PT_LOAD or bool(p_flags & PF_X) != executable:
+            continue
+        data = bytearray(image[p_offset: p_offset + p_filesz])
+        data += bytearray(p_memsz - p_filesz)  # .bss
+        if order == "<":
+            segments.append(swap_words(p_vaddr, data))
+        else:
+            segments.append((p_vaddr, data))
+    return segments
+
+
+def load_segments(path: str, executable: bool = False) -> list:
+    # (address, buffer) of every loaded region of path, in the simulator byte order
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".bin":
+        return [(0, map_packed(path))]
+    if extension == ".raw":
+        with open(path, "rb") as file:
+            return [swap_words(0, file.read())]
+    if extension == ".hex":
+        return [swap_words(address, data) for address, data in read_hex(path)]
+    if extension == ".elf":
+        return read_elf(path, executable)
+    return [(0, read_text(path))]
+
+
+def load_program(path: str):
+    # contiguous instruction memory image starting at address 0
+    segments = load_segments(path, executable=True)
+    if len(segments) == 1 and segments[0][0] == 0:
+        return segments[0][1]
+    if not segments:
+        return bytearray()
+    base = min(address for address, _ in segments)
+    image = bytearray(max(address + len(data) for address, data in segments) - base)
+    for address, data in segments:
+        image[address - base: address - base + len(data)] = data
+    return image
+
+
+def pack_data(segments) -> bytearray:
+    # dense image from address 0 of data segments - the packed form has no addresses, so sparse images (data
+    # relocated to 0x10000000, ...) would be mostly zero fill and are refused
+    size = max((address + len(data) for address, data in segments), default=0)
+    if size - sum(len(data) for _, data in segments) > MAX_DATA_GAP:
+        raise ValueError(f"sparse data image ({len(segments)} segments up to {size:#x}) has no packed form, "
+                         f"use it in its original format")
+    image = bytearray(size)
+    for address, data in segments:
+        image[address: address + len(data)] = data
+    return image
+
+
+def pack(image, path: str):
+    with open(path, "wb") as file:
+        file.write(image)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a memory image to the packed .bin form')
+    parser.add_argument("input", type=str, help="Input image (.txt, .bin, .raw, .hex or .elf).")
+    parser.add_argument("output", type=str, help="Output .bin path.")
+    parser.add_argument("--data", action="store_true",
+                        help="Convert a data image (non-executable ELF segments, addresses kept) instead of a program.")
+    args = parser.parse_args()
+
+    if args.data:
+        try:
+            image = pack_data(load_segments(args.input))
+        except ValueError as error:
+            print(f"{args.input}: {error}", file=sys.stderr)
+            return 1
+    else:
+        image = load_program(args.input)
+    pack(image, args.output)
+    print(f"{len(image)} bytes written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
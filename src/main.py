@@ -1,8 +1,17 @@
 import argparse
+import functools
 import os
+import time
 
-from models import DataMem, InsMem
+from branch_predictor import PREDICTORS, DEFAULT_BTB_ENTRIES, make_predictor
+from cache import Cache, CacheConfig
+from checkpoint import CheckpointSchedule, parse_points, restore_any
+from functional import FunctionalCore
+from models import DataMem, InsMem, MemSize
 from rv32i import SingleStageCore, FiveStageCore
+from runner import run_parallel
+from sampling import SampledSimulation, SamplingConfig
+from tracing import TraceWriter, TracePolicy, DEFAULT_BUFFER_SIZE
 
 
 def main():
@@ -10,6 +19,39 @@ def main():
     parser = argparse.ArgumentParser(description='RV32I processor')
     parser.add_argument('--iodir', default="", type=str, help='Directory containing the input files.')
     parser.add_argument("--testpath", default="", type=str, help="Test Case Path")
+    parser.add_argument("--mem-size", default=MemSize, type=int,
+                        help="Minimum number of bytes written to the DMEM dump in compat mode.")
+    parser.add_argument("--dmem-dump", default="compat", choices=["compat", "compact"],
+                        help="compat: one line per byte from address 0, compact: only touched pages.")
+    parser.add_argument("--trace-buffer", default=DEFAULT_BUFFER_SIZE, type=int,
+                        help="Write buffer size in bytes of each RF / state trace file.")
+    parser.add_argument("--trace", default=TracePolicy(), type=TracePolicy.parse,
+                        help="Cycles dumped to the RF / state traces: none, final, every-N or full (default).")
+    parser.add_argument("--functional", action="store_true",
+                        help="Run only the fast functional engine and write FUNC_RFResult.txt / FUNC_DMEMResult.txt.")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Run the SS and FS cores to completion in two separate worker processes.")
+    parser.add_argument("--predictor", default="not-taken", choices=list(PREDICTORS),
+                        help="Branch predictor of the five stage core IF stage (default not-taken).")
+    parser.add_argument("--btb-entries", default=DEFAULT_BTB_ENTRIES, type=int,
+                        help="Number of branch target buffer entries of the predictor.")
+    parser.add_argument("--icache", default=None, type=CacheConfig.parse,
+                        help="Five stage core L1 I-cache, e.g. size=4096,assoc=2,line=16,policy=lru,hit=1,miss=10.")
+    parser.add_argument("--dcache", default=None, type=CacheConfig.parse,
+                        help="Five stage core L1 D-cache, same options plus write=back|through.")
+    parser.add_argument("--checkpoint-at", default=[], type=parse_points,
+                        help="Comma separated cycles after which each core saves <core>_checkpoint_c<cycle>.json.")
+    parser.add_argument("--checkpoint-at-insn", default=[], type=parse_points,
+                        help="Comma separated instruction counts at which each core saves "
+                             "<core>_checkpoint_i<count>.json.")
+    parser.add_argument("--restore", default=[], action="append",
+                        help="Resume from a checkpoint file. Repeat to give the SS and FS cores their own snapshots, "
+                             "a core takes the snapshot of its own kind, else a functional / architectural one.")
+    parser.add_argument("--sample", default=None, type=SamplingConfig.parse,
+                        help="Sampled five stage simulation, e.g. skip=100000,warmup=2000,detail=1000,fill=5: "
+                             "writes FS_SampledPerformanceMetrics.txt and FS_Sampling.json.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time the pipeline sections of every step, writes SS_/FS_Profile.txt and .json at halt.")
     args = parser.parse_args()
     test_case_number = 1
 
@@ -21,33 +63,94 @@ def main():
 
     if ioTest == "":
         imem = InsMem("Imem", ioDir, ioTest=ioTest, tc=test_case_number)
-        dmem_ss = DataMem("SS", ioDir, ioTest=ioTest, tc=test_case_number)
-        dmem_fs = DataMem("FS", ioDir, ioTest=ioTest, tc=test_case_number)
+        dmem_ss = DataMem("SS", ioDir, mem_size=args.mem_size, ioTest=ioTest, tc=test_case_number)
+        dmem_fs = DataMem("FS", ioDir, mem_size=args.mem_size, ioTest=ioTest, tc=test_case_number)
     else:
         imem = InsMem("Imem", ioDir)
-        dmem_ss = DataMem("SS", ioDir)
-        dmem_fs = DataMem("FS", ioDir)
+        dmem_ss = DataMem("SS", ioDir, mem_size=args.mem_size)
+        dmem_fs = DataMem("FS", ioDir, mem_size=args.mem_size)
 
-    ssCore = SingleStageCore(ioDir, imem, dmem_ss)
-    fsCore = FiveStageCore(ioDir, imem, dmem_fs)
+    if args.functional:
+        schedule = CheckpointSchedule(ioDir + "/FUNC_", args.checkpoint_at, args.checkpoint_at_insn)
+        run_functional(imem, DataMem("FUNC", ioDir, mem_size=args.mem_size), ioDir, args.dmem_dump, schedule,
+                       args.restore)
+        return
 
-    while True:
-        if not ssCore.halted:
-            ssCore.step()
+    if args.sample is not None:
+        simulation = SampledSimulation(ioDir, imem, DataMem("FUNC", ioDir, mem_size=args.mem_size), args.sample,
+                                       make_predictor(args.predictor, args.btb_entries),
+                                       Cache("I-cache", args.icache) if args.icache is not None else None,
+                                       Cache("D-cache", args.dcache) if args.dcache is not None else None)
+        simulation.run()
+        simulation.output()
+        print(simulation.metrics(), end="")
+        return
 
-        if not fsCore.halted:
-            fsCore.step()
+    if args.parallel:
+        run_parallel(ioDir, mem_size=args.mem_size, dmem_dump=args.dmem_dump, trace_policy=args.trace,
+                     trace_buffer=args.trace_buffer, predictor=args.predictor, btb_entries=args.btb_entries,
+                     icache=args.icache, dcache=args.dcache, checkpoint_cycles=args.checkpoint_at,
+                     checkpoint_instructions=args.checkpoint_at_insn, restore=args.restore, profile=args.profile)
+        return
 
-        if ssCore.halted and fsCore.halted:
-            break
+    trace_writer = functools.partial(TraceWriter, buffer_size=args.trace_buffer)
+    ssCore = SingleStageCore(ioDir, imem, dmem_ss, trace_writer, args.trace,
+                             translate=not (args.checkpoint_at or args.checkpoint_at_insn))
+    fsCore = FiveStageCore(ioDir, imem, dmem_fs, trace_writer, args.trace,
+                           make_predictor(args.predictor, args.btb_entries), args.icache, args.dcache)
+
+    schedules = {}
+    for core in (ssCore, fsCore):
+        if args.restore:
+            restore_any(core, args.restore)
+        schedules[core] = CheckpointSchedule(core.ioDir, args.checkpoint_at, args.checkpoint_at_insn)
+        if args.profile:
+            core.enable_profiling()
+
+    try:
+        while True:
+            if not ssCore.halted:
+                ssCore.step()
+                if schedules[ssCore]:
+                    schedules[ssCore].after_step(ssCore)
+
+            if not fsCore.halted:
+                fsCore.step()
+                if schedules[fsCore]:
+                    schedules[fsCore].after_step(fsCore)
+
+            if ssCore.halted and fsCore.halted:
+                break
+    finally:
+        # keep the traces written up to a failing cycle
+        ssCore.close_traces()
+        fsCore.close_traces()
 
     # dump SS and FS data mem.
-    dmem_ss.output_data_mem()
-    dmem_fs.output_data_mem()
+    dmem_ss.output_data_mem(args.dmem_dump)
+    dmem_fs.output_data_mem(args.dmem_dump)
 
     # dumps SS and DS Performance
     ssCore.calculate_performance_metrics()
     fsCore.calculate_performance_metrics()
+    fsCore.output_counters()
+
+
+def run_functional(imem: InsMem, dmem: DataMem, io_dir: str, dmem_dump: str, schedule=None, restore=()):
+    core = FunctionalCore(imem, dmem)
+    if restore:
+        restore_any(core, restore)
+    start = time.perf_counter()
+    if schedule:
+        schedule.run_functional(core)
+    else:
+        core.run()
+    elapsed = time.perf_counter() - start
+
+    dmem.output_data_mem(dmem_dump)
+    core.output_rf(io_dir + "/FUNC_RFResult.txt")
+    print(f"Functional Core: {core.instruction_count} instructions in {elapsed:.6f} s "
+          f"({core.instruction_count / max(elapsed, 1e-9):.0f} instructions/s)")
 
 
 if __name__ == "__main__":
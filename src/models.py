@@ -1,6 +1,37 @@
 import json
+import sys
+from typing import NamedTuple, Optional
 
-from bitstring import BitArray
+import program_cache
+from loader import find_input, load_program, load_segments
+from tracing import TraceWriter
+
+# memory size, in reality, the memory size should be 2^32, but for this lab, for the space reason
+# we keep it as this large number, but the memory is still 32-bit addressable.
+# DataMem is sparse, MemSize is only the number of bytes emitted by the compatibility DMEM dump.
+MemSize = 1000
+
+# DataMem page geometry - pages are allocated on first touch
+PageBits = 12
+PageSize = 1 << PageBits
+PageMask = PageSize - 1
+AddressMask = 0xffffffff
+
+
+class DecodedInstruction(NamedTuple):
+    # Immutable record produced once per instruction word by the predecode stage (see predecode.py)
+    mnemonic: str  # lower case mnemonic understood by get_instruction_class, "halt" or "invalid"
+    rd: int = 0  # destination register
+    rs1: int = 0  # source register 1
+    rs2: int = 0  # source register 2
+    imm: int = 0  # sign-extended immediate
+    handler: Optional[type] = None  # InstructionBase subclass executing the instruction
+    bits: str = "0" * 32  # 32-bit binary instruction string as read from IMEM
+    word: int = 0  # instruction word as an unsigned integer
+
+    @property
+    def is_halt(self) -> bool:
+        return self.mnemonic == "halt"
 
 
 class InsMem(object):
@@ -15,76 +46,150 @@ class InsMem(object):
 
         print(input_file_path)
 
-        with open(input_file_path + "/imem.txt") as im:
-            self.IMem = [data.replace("\n", "") for data in im.readlines()]
+        # instruction bytes, most significant byte of every word first - imem.txt or another format of loader.py
+        self.source = find_input(input_file_path, "imem")
+        self.source_digest, cached = program_cache.load(self.source, "imem")
+        if cached is not None:
+            self.IMem = cached.segments[0][1] if cached.segments else bytearray()
+        else:
+            self.IMem = load_program(self.source)
+        # predecoded records of the program cache, predecode() stores them there on a miss
+        self.cached_records = cached.records if cached is not None else None
 
-    def read_instr(self, read_address: int):
+        # Predecoded instruction table shared by every core reading this memory - built by predecode.predecode()
+        self.decoded = None
+
+    def read_word(self, read_address: int) -> int:
         # DONE: Handle word addressing - use nearest lower multiple for 4 for address = x - x % 4
         read_address = read_address - read_address % 4
         if len(self.IMem) < read_address + 4:
             raise Exception("Instruction MEM - Out of bound access")
-        return "".join(self.IMem[read_address: read_address + 4])
+        return int.from_bytes(self.IMem[read_address: read_address + 4], "big")
+
+    def read_instr(self, read_address: int):
+        # 32-bit binary string of the instruction word
+        return '{:032b}'.format(self.read_word(read_address))
+
+    def write_instr(self, address: int, write_data: int):
+        # write an instruction word (self modifying code) and drop the stale predecoded entry
+        address = address - address % 4
+        if len(self.IMem) < address + 4:
+            raise Exception("Instruction MEM - Out of bound access")
+        self.IMem[address: address + 4] = (write_data & 0xffffffff).to_bytes(4, "big")
+        if self.decoded is not None:
+            self.decoded.invalidate(address)
 
 
 class DataMem(object):
-    def __init__(self, name, io_dir, **kwargs):
+    # Sparse, paged data memory covering the whole 32-bit address space. Pages of PageSize bytes are
+    # allocated on the first store that touches them, reads of untouched pages return 0 without allocating.
+    def __init__(self, name, io_dir, byteorder="big", mem_size=MemSize, **kwargs):
         self.id = name
         self.io_dir = io_dir
+        # order of the bytes of a word in memory - dmem.txt stores the most significant byte first
+        self.byteorder = byteorder
+        self.pages = {}  # page number -> bytearray(PageSize)
 
         if "ioTest" not in kwargs:
             input_file_path = io_dir
         else:
             input_file_path = kwargs["ioTest"] + f"/TC{kwargs['tc']}"
 
-        with open(input_file_path + "/dmem.txt") as dm:
-            self.DMem = [data.replace("\n", "") for data in dm.readlines()]
-            self.DMem += ["0" * 8] * (1000 - len(self.DMem))
+        # number of bytes emitted by the compatibility dump: mem_size, or the input image loaded from address 0
+        # if it is larger. Relocated segments and stores past the end are only in the compact dump.
+        self.size = mem_size
+        # dmem.txt or another format of loader.py
+        source = find_input(input_file_path, "dmem")
+        digest, cached = program_cache.load(source, "dmem")
+        if cached is not None:
+            segments = cached.segments
+        else:
+            segments = load_segments(source)
+            program_cache.store(source, "dmem", digest, segments)
+        for address, image in sorted(segments, key=lambda segment: segment[0]):
+            self.load(address, image)
+            if address <= self.size:
+                self.size = max(self.size, address + len(image))
+
+    def load(self, address: int, image):
+        # copy image to address, page by page
+        end = address + len(image)
+        position = address
+        while position < end:
+            offset = position & PageMask
+            count = min(PageSize - offset, end - position)
+            self._page(position)[offset: offset + count] = image[position - address: position - address + count]
+            position += count
+
+    def _page(self, address: int) -> bytearray:
+        page = self.pages.get(address >> PageBits)
+        if page is None:
+            page = self.pages[address >> PageBits] = bytearray(PageSize)
+        return page
 
     def read_data(self, read_address: int) -> int:
         # read data memory
         # return 32-bit signed int value
 
         # DONE: Handle word addressing - use nearest lower multiple for 4 for address = x - x % 4
-        read_address = read_address - read_address % 4
-        if len(self.DMem) < read_address + 4:
-            raise Exception("Data MEM - Out of bound access")
-        return BitArray(bin="".join(self.DMem[read_address: read_address + 4])).int32
+        read_address = (read_address - read_address % 4) & AddressMask
+        page = self.pages.get(read_address >> PageBits)
+        if page is None:
+            return 0
+        offset = read_address & PageMask
+        return int.from_bytes(page[offset: offset + 4], self.byteorder, signed=True)
 
     def write_data_mem(self, address: int, write_data: int):
         # write data into byte addressable memory
         # Assuming data as 32 bit signed integer
 
-        # Converting from int to bin
-
         # DONE: Handle word addressing - use nearest lower multiple for 4 for address = x - x % 4
-        address = address - address % 4
-        write_data = '{:032b}'.format(write_data & 0xffffffff)
-
-        left, right, zeroes = [], [], []
-
-        if address <= len(self.DMem):
-            left = self.DMem[:address]
-        else:
-            left = self.DMem
-            zeroes = ["0" * 8] * (address - len(self.DMem))
-        if address + 4 <= len(self.DMem):
-            right = self.DMem[address + 4:]
-
-        self.DMem = left + zeroes + [write_data[i: i + 8] for i in range(0, 32, 8)] + right
-
-    def output_data_mem(self):
+        address = (address - address % 4) & AddressMask
+        offset = address & PageMask
+        self._page(address)[offset: offset + 4] = (write_data & 0xffffffff).to_bytes(4, self.byteorder)
+
+    def touched_ranges(self):
+        # (start address, end address) of every run of consecutive allocated pages, in address order
+        ranges = []
+        for number in sorted(self.pages):
+            if ranges and ranges[-1][1] == number << PageBits:
+                ranges[-1][1] += PageSize
+            else:
+                ranges.append([number << PageBits, (number + 1) << PageBits])
+        return [tuple(r) for r in ranges]
+
+    def read_bytes(self, start: int, end: int) -> bytearray:
+        data = bytearray()
+        for address in range(start - start % PageSize, end, PageSize):
+            page = self.pages.get(address >> PageBits)
+            data += page if page is not None else bytes(PageSize)
+        return data[start % PageSize: start % PageSize + end - start]
+
+    def output_data_mem(self, mode="compat"):
         if self.id == 'SS':
             res_path = self.io_dir + "/" + self.id + "_DMEMResult.txt"
         else:
             res_path = self.io_dir + "/" + self.id + "_DMEMResult.txt"
         with open(res_path, "w") as rp:
-            rp.writelines([str(data) + "\n" for data in self.DMem])
+            if mode == "compact":
+                # only touched pages, each run preceded by its start address: @<hex address>
+                for start, end in self.touched_ranges():
+                    rp.write("@{:08x}\n".format(start))
+                    rp.writelines(['{:08b}\n'.format(data) for data in self.read_bytes(start, end)])
+            else:
+                # compatibility dump: one line per byte of the first self.size bytes
+                rp.writelines(['{:08b}\n'.format(data) for data in self.read_bytes(0, self.size)])
+                if any(any(self.read_bytes(max(start, self.size), end))
+                       for start, end in self.touched_ranges() if end > self.size):
+                    print(f"{res_path}: data memory beyond {self.size} bytes is not in the compat dump, "
+                          f"use --dmem-dump compact to write it", file=sys.stderr)
 
 
 class RegisterFile(object):
-    def __init__(self, io_dir):
+    def __init__(self, io_dir, trace_writer=TraceWriter):
         self.output_file = io_dir + "RFResult.txt"
         self.registers = [0x0 for _ in range(32)]
+        self.trace = trace_writer(self.output_file)
 
     def read_rf(self, reg_addr: int) -> int:
         return self.registers[reg_addr]
@@ -96,31 +201,44 @@ class RegisterFile(object):
     def output_rf(self, cycle):
         op = ["State of RF after executing cycle:\t" + str(cycle) + "\n"]
         op.extend(['{:032b}'.format(val & 0xffffffff) + "\n" for val in self.registers])
-        if cycle == 0:
-            perm = "w"
-        else:
-            perm = "a"
-        with open(self.output_file, perm) as file:
-            file.writelines(op)
+        self.trace.writelines(op)
 
 
 class IntermediateState:
+    # Pipeline latch. Fields are __slots__ (no per object attribute dict) and the latch objects of a State are
+    # allocated once and reused every cycle: reset() restores the field defaults in place, copy_from(other) takes
+    # the field values of another latch of the same stage (shallow, instruction_ob is shared). copy_from runs for
+    # every latch every cycle, so each latch class spells out its fields instead of looping over __slots__.
+    __slots__ = ()
 
     def __init__(self):
+        self.reset()
+
+    def reset(self):
         pass
 
     def set_attributes(self, **kwargs):
-        self.__dict__.update(kwargs)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def fields(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
 
 
 class IFState(IntermediateState):
+    __slots__ = ("nop", "PC", "instruction_count", "halt")
 
-    def __init__(self):
+    def reset(self):
         self.nop: bool = False  # NOP operation
         self.PC: int = 0  # Program Counter
         self.instruction_count: int = 0  # count of instructions fetched - used for performance metrics
         self.halt: bool = False  # Flag - identify end of program
-        super(IFState, self).__init__()
+
+    def copy_from(self, other):
+        self.nop = other.nop
+        self.PC = other.PC
+        self.instruction_count = other.instruction_count
+        self.halt = other.halt
 
     def __str__(self):
         # Format for desired output - only show nop and PC
@@ -128,13 +246,24 @@ class IFState(IntermediateState):
 
 
 class IDState(IntermediateState):
+    __slots__ = ("nop", "instruction_bytes", "PC", "predicted_taken", "predicted_target", "halt")
 
-    def __init__(self):
+    def reset(self):
         self.nop: bool = False  # NOP operation
         self.instruction_bytes: str = ""  # Binary Instruction string
+        self.PC: int = 0  # address instruction_bytes was fetched from - index into the predecoded table
+        self.predicted_taken: bool = False  # IF redirected fetch after this instruction (branch predictor)
+        self.predicted_target: int = 0  # address fetched next when predicted_taken
         # self.instruction_ob = None  # Decoded InstructionBase object
         self.halt: bool = False  # Flag - identify end of program
-        super(IDState, self).__init__()
+
+    def copy_from(self, other):
+        self.nop = other.nop
+        self.instruction_bytes = other.instruction_bytes
+        self.PC = other.PC
+        self.predicted_taken = other.predicted_taken
+        self.predicted_target = other.predicted_target
+        self.halt = other.halt
 
     def __str__(self):
         # Format for desired output - rename instruction_bytes to Instr
@@ -142,8 +271,10 @@ class IDState(IntermediateState):
 
 
 class EXState(IntermediateState):
+    __slots__ = ("nop", "instruction_ob", "instr_binary", "operand1", "operand2", "store_data", "destination_register",
+                 "rs1", "rs2", "imm", "is_i_type", "read_data_mem", "write_data_mem", "write_back_enable", "halt")
 
-    def __init__(self):
+    def reset(self):
         self.nop: bool = False  # NOP operation
         self.instruction_ob = None  # Decoded InstructionBase object
         self.instr_binary: str = ""  # 32-bit binary instruction string
@@ -160,7 +291,23 @@ class EXState(IntermediateState):
         self.write_data_mem: bool = False  # Flag - identify if we need to write to mem (MEM Stage)
         self.write_back_enable: bool = False  # Flag - identify if result needs to be written back to register
         self.halt: bool = False  # Flag - identify end of program
-        super(EXState, self).__init__()
+
+    def copy_from(self, other):
+        self.nop = other.nop
+        self.instruction_ob = other.instruction_ob
+        self.instr_binary = other.instr_binary
+        self.operand1 = other.operand1
+        self.operand2 = other.operand2
+        self.store_data = other.store_data
+        self.destination_register = other.destination_register
+        self.rs1 = other.rs1
+        self.rs2 = other.rs2
+        self.imm = other.imm
+        self.is_i_type = other.is_i_type
+        self.read_data_mem = other.read_data_mem
+        self.write_data_mem = other.write_data_mem
+        self.write_back_enable = other.write_back_enable
+        self.halt = other.halt
 
     def __str__(self):
         # Format for desired output
@@ -218,8 +365,10 @@ class EXState(IntermediateState):
 
 
 class MEMState(IntermediateState):
+    __slots__ = ("nop", "instruction_ob", "alu_result", "data_address", "store_data", "write_register_addr", "rs1",
+                 "rs2", "read_data_mem", "write_data_mem", "write_back_enable", "halt")
 
-    def __init__(self):
+    def reset(self):
         self.nop: bool = False  # NOP operation
         self.instruction_ob = None  # Decoded InstructionBase object
         self.alu_result: int = 0  # ALU result from EX stage
@@ -232,7 +381,20 @@ class MEMState(IntermediateState):
         self.write_data_mem: bool = False  # Flag - identify if we need to write to mem (MEM Stage)
         self.write_back_enable: bool = False  # Flag - identify if result needs to be written back to register
         self.halt: bool = False  # Flag - identify end of program
-        super(MEMState, self).__init__()
+
+    def copy_from(self, other):
+        self.nop = other.nop
+        self.instruction_ob = other.instruction_ob
+        self.alu_result = other.alu_result
+        self.data_address = other.data_address
+        self.store_data = other.store_data
+        self.write_register_addr = other.write_register_addr
+        self.rs1 = other.rs1
+        self.rs2 = other.rs2
+        self.read_data_mem = other.read_data_mem
+        self.write_data_mem = other.write_data_mem
+        self.write_back_enable = other.write_back_enable
+        self.halt = other.halt
 
     def __str__(self):
         # Format for desired output
@@ -262,8 +424,10 @@ class MEMState(IntermediateState):
 
 
 class WBState(IntermediateState):
+    __slots__ = ("nop", "instruction_ob", "store_data", "write_register_addr", "rs1", "rs2", "write_back_enable",
+                 "halt")
 
-    def __init__(self):
+    def reset(self):
         self.nop = False  # NOP operation
         self.instruction_ob = None  # Decoded InstructionBase object
         self.store_data: int = 0  # data to be written to MEM for SW instruction
@@ -272,7 +436,16 @@ class WBState(IntermediateState):
         self.rs2: int = 0  # source register 2 address (propagated from MEM)
         self.write_back_enable: bool = False  # Flag - identify if result needs to be written back to register
         self.halt: bool = False  # Flag - identify end of program
-        super(WBState, self).__init__()
+
+    def copy_from(self, other):
+        self.nop = other.nop
+        self.instruction_ob = other.instruction_ob
+        self.store_data = other.store_data
+        self.write_register_addr = other.write_register_addr
+        self.rs1 = other.rs1
+        self.rs2 = other.rs2
+        self.write_back_enable = other.write_back_enable
+        self.halt = other.halt
 
     def __str__(self):
         # Format for desired output
@@ -295,6 +468,9 @@ class WBState(IntermediateState):
 
 
 class State(object):
+    # The five latches of one side of the double buffered pipeline. Each State owns its latch objects: stages
+    # update the nextState latches in place, end of cycle copies values, latches are never shared between States.
+    __slots__ = ("IF", "ID", "EX", "MEM", "WB")
 
     def __init__(self):
         self.IF: IFState = IFState()
@@ -307,6 +483,12 @@ class State(object):
 
         self.WB = WBState()
 
+    def reset_latch(self, stage: str) -> IntermediateState:
+        # the latch of stage ("IF" ... "WB") back to its defaults, ready to be filled in for the next cycle
+        latch = getattr(self, stage)
+        latch.reset()
+        return latch
+
     def nop_init(self):
         self.IF.nop = False
         self.ID.nop = True
@@ -314,6 +496,15 @@ class State(object):
         self.MEM.nop = True
         self.WB.nop = True
 
+    def copy_from(self, other):
+        # Carry the latch values of other into this State without deepcopy: used at the end of every cycle
+        # after swapping state / nextState so that nextState starts from the values just computed
+        self.IF.copy_from(other.IF)
+        self.ID.copy_from(other.ID)
+        self.EX.copy_from(other.EX)
+        self.MEM.copy_from(other.MEM)
+        self.WB.copy_from(other.WB)
+
     def __str__(self):
         # DONE: update __str__ to make use of individual State objects
         # No blank lines between stages - just newlines between them
@@ -0,0 +1,112 @@
+import batch_decoder
+import program_cache
+from decoder import decode, MachineDecodeError
+from instructions import get_instruction_class
+from models import InsMem, DecodedInstruction
+
+HALT_WORD = 0xffffffff
+# programs of at least this many words are decoded with the batch decoder when NumPy is installed
+BATCH_WORDS = 256
+
+HANDLERS = {}  # mnemonic -> InstructionBase subclass, None if unsupported
+
+
+def decode_word(word: int) -> DecodedInstruction:
+    # Decode one 32-bit instruction word into an immutable DecodedInstruction record.
+    # HALT (all ones) and undecodable words get their own records so the cores can keep their
+    # original halt / "Invalid Instruction" behavior when (and only when) such a word is executed.
+    bits = '{:032b}'.format(word)
+    try:
+        instruction = decode(word)
+    except MachineDecodeError as e:
+        mnemonic = "halt" if e.word == HALT_WORD else "invalid"
+        return DecodedInstruction(mnemonic=mnemonic, bits=bits, word=word)
+
+    return make_record(word, *instruction)
+
+
+def make_record(word: int, mnemonic: str, rd: int, rs1: int, rs2: int, imm: int) -> DecodedInstruction:
+    # DecodedInstruction of decoded fields, also used to rebuild the records of the program cache
+    if mnemonic in ("halt", "invalid"):
+        return DecodedInstruction(mnemonic=mnemonic, bits='{:032b}'.format(word), word=word)
+    return DecodedInstruction(mnemonic=mnemonic, rd=rd, rs1=rs1, rs2=rs2, imm=imm, handler=handler_of(mnemonic),
+                              bits='{:032b}'.format(word), word=word)
+
+
+def handler_of(mnemonic: str):
+    # InstructionBase subclass executing mnemonic, None for halt / invalid / decodable but unsupported words
+    if mnemonic not in HANDLERS:
+        try:
+            HANDLERS[mnemonic] = get_instruction_class(mnemonic) if mnemonic not in ("halt", "invalid") else None
+        except Exception:
+            HANDLERS[mnemonic] = None  # raises when executed
+    return HANDLERS[mnemonic]
+
+
+class DecodedProgram(object):
+    # Table of DecodedInstruction records for the whole instruction memory, indexed by PC.
+    # Built once at load time and shared by both cores through the InsMem it was built from.
+
+    def __init__(self, imem: InsMem, records=None):
+        # records: (word, mnemonic, rd, rs1, rs2, imm) of every word loaded from the program cache
+        self.imem = imem
+        if records is not None:
+            self.table = [make_record(*record) for record in records]
+        else:
+            self.table = decode_table(imem.IMem)
+        self.version = 0  # bumped on every invalidation, caches derived from the table compare it
+
+    def _decode_at(self, address: int) -> DecodedInstruction:
+        return decode_word(self.imem.read_word(address))
+
+    def fetch(self, pc: int) -> DecodedInstruction:
+        index = pc >> 2
+        if index < 0 or index >= len(self.table):
+            raise Exception("Instruction MEM - Out of bound access")
+        record = self.table[index]
+        if record is None:
+            # entry invalidated by a write into instruction memory - decode it again
+            record = self.table[index] = self._decode_at(pc - pc % 4)
+        return record
+
+    def invalidate(self, address: int):
+        index = address >> 2
+        if 0 <= index < len(self.table):
+            self.table[index] = None
+        self.version += 1
+
+
+def decode_table(image) -> list:
+    # DecodedInstruction of every word of an instruction memory image (bytes, bytearray or mmap)
+    count = len(image) // 4
+    if not batch_decoder.available() or count < BATCH_WORDS:
+        return [decode_word(int.from_bytes(image[address: address + 4], "big")) for address in range(0, count * 4, 4)]
+    mnemonics = [mnemonic.lower() for mnemonic in batch_decoder.mnemonics()]
+    handlers = [handler_of(mnemonic) for mnemonic in mnemonics]
+    words = batch_decoder.image_words(image)
+    # bit strings of all words at once, sliced per word below
+    bits = '{:0{}b}'.format(int.from_bytes(image[:count * 4], "big"), count * 32)
+    table = []
+    position = 0
+    for word, (number, rd, rs1, rs2, imm) in zip(words.tolist(), batch_decoder.decode_words(words).tolist()):
+        if number < 0:
+            # not in encoding.json: LW with the RV32I funct3 or an invalid word
+            table.append(decode_word(word))
+        else:
+            table.append(DecodedInstruction(mnemonics[number], rd, rs1, rs2, imm, handlers[number],
+                                            bits[position: position + 32], word))
+        position += 32
+    return table
+
+
+def predecode(imem: InsMem) -> DecodedProgram:
+    # Return the predecoded table of imem, building it on first use
+    if imem.decoded is None:
+        if imem.cached_records is not None and len(imem.cached_records) == len(imem.IMem) // 4:
+            imem.decoded = DecodedProgram(imem, imem.cached_records)
+        else:
+            imem.decoded = DecodedProgram(imem)
+            records = [(record.word, record.mnemonic, record.rd, record.rs1, record.rs2, record.imm)
+                       for record in imem.decoded.table]
+            program_cache.store(imem.source, "imem", imem.source_digest, [(0, imem.IMem)], records)
+    return imem.decoded
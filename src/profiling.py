@@ -0,0 +1,104 @@
+import json
+import time
+
+# Opt-in wall time profiling of the sections of Core.step(). The core calls start() at the beginning of a step and
+# lap(section) at the end of every section: the time since the previous lap is charged to that section.
+# Durations go into power of two nanosecond buckets: bucket b holds durations in [2^(b-1), 2^b) ns.
+# Disabled profiling is a None profiler, the cores test it with one `if` per section.
+
+
+class SectionStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.histogram = {}  # bucket -> calls
+
+    def add(self, duration: int):
+        self.calls += 1
+        self.total_ns += duration
+        if self.min_ns is None or duration < self.min_ns:
+            self.min_ns = duration
+        if duration > self.max_ns:
+            self.max_ns = duration
+        bucket = duration.bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def percentile(self, fraction: float) -> int:
+        # upper bound of the bucket holding the given fraction of the calls
+        target = fraction * self.calls
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= target:
+                return 1 << bucket
+        return self.max_ns
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "total_ns": self.total_ns,
+            "mean_ns": self.total_ns / self.calls if self.calls else 0,
+            "min_ns": self.min_ns or 0,
+            "max_ns": self.max_ns,
+            "p50_ns": self.percentile(0.5),
+            "p99_ns": self.percentile(0.99),
+            "histogram": {f"<{1 << bucket}": calls for bucket, calls in sorted(self.histogram.items())},
+        }
+
+
+class StageProfiler(object):
+    def __init__(self, name: str):
+        self.name = name
+        self.sections = {}  # section name -> SectionStats, in first lap order
+        self.steps = 0
+        self.last = 0
+
+    def start(self):
+        self.steps += 1
+        self.last = time.perf_counter_ns()
+
+    def lap(self, section: str):
+        now = time.perf_counter_ns()
+        stats = self.sections.get(section)
+        if stats is None:
+            stats = self.sections[section] = SectionStats()
+        stats.add(now - self.last)
+        self.last = now
+
+    @property
+    def total_ns(self) -> int:
+        return sum(stats.total_ns for stats in self.sections.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "core": self.name,
+            "steps": self.steps,
+            "total_ns": self.total_ns,
+            "sections": {name: stats.as_dict() for name, stats in self.sections.items()},
+        }
+
+    def report(self) -> str:
+        total = self.total_ns or 1
+        lines = [f"{self.name} Core Profile-----------------------------\n",
+                 f"Steps: {self.steps}, profiled time: {self.total_ns / 1e6:.3f} ms\n",
+                 f"{'section':10s} {'calls':>10s} {'total ms':>10s} {'share':>7s} {'mean ns':>10s} "
+                 f"{'p50 ns':>9s} {'p99 ns':>9s} {'max ns':>10s}\n"]
+        for name, stats in self.sections.items():
+            lines.append(f"{name:10s} {stats.calls:10d} {stats.total_ns / 1e6:10.3f} {100 * stats.total_ns / total:6.1f}% "
+                         f"{stats.total_ns / stats.calls:10.0f} {stats.percentile(0.5):9d} {stats.percentile(0.99):9d} "
+                         f"{stats.max_ns:10d}\n")
+        lines.append("Histograms (calls per duration bucket):\n")
+        for name, stats in self.sections.items():
+            buckets = ", ".join(f"<{1 << bucket}ns: {calls}" for bucket, calls in sorted(stats.histogram.items()))
+            lines.append(f"{name:10s} {buckets}\n")
+        return "".join(lines)
+
+    def write(self, prefix: str):
+        # <prefix>Profile.txt and <prefix>Profile.json, e.g. FS_Profile.txt
+        with open(prefix + "Profile.txt", "w") as file:
+            file.write(self.report())
+        with open(prefix + "Profile.json", "w") as file:
+            json.dump(self.as_dict(), file, indent=2)
+            file.write("\n")
@@ -0,0 +1,140 @@
+import os
+
+from assembler import encode, write_bytes
+
+# Builds RV32I test programs for the simulator from Python: one method per supported instruction, labels for
+# branch / jump targets, and a data image. Instructions are encoded with the assembler's encoding.json table,
+# write() emits imem.txt / dmem.txt in the input format of the cores (one byte per line, most significant byte of
+# every word first).
+
+
+class ProgramBuilder(object):
+    def __init__(self):
+        self.words = []  # instruction words, None where a label still has to be resolved
+        self.fixups = []  # (index, mnemonic, registers, label) of branches / jumps to labels
+        self.labels = {}  # label -> address
+        self.data = []  # initial data memory, one 32-bit word per entry from address 0
+
+    @property
+    def pc(self) -> int:
+        return len(self.words) * 4
+
+    def label(self, name: str):
+        if name in self.labels:
+            raise Exception(f"Duplicate label: {name}")
+        self.labels[name] = self.pc
+
+    def emit(self, word: int):
+        self.words.append(word & 0xffffffff)
+
+    # R-type
+    def add(self, rd: int, rs1: int, rs2: int):
+        self.emit(encode("ADD", rd, rs1, rs2))
+
+    def sub(self, rd: int, rs1: int, rs2: int):
+        self.emit(encode("SUB", rd, rs1, rs2))
+
+    def xor(self, rd: int, rs1: int, rs2: int):
+        self.emit(encode("XOR", rd, rs1, rs2))
+
+    def or_(self, rd: int, rs1: int, rs2: int):
+        self.emit(encode("OR", rd, rs1, rs2))
+
+    def and_(self, rd: int, rs1: int, rs2: int):
+        self.emit(encode("AND", rd, rs1, rs2))
+
+    # I-type
+    def addi(self, rd: int, rs1: int, imm: int):
+        self.emit(encode("ADDI", rd, rs1, imm))
+
+    def xori(self, rd: int, rs1: int, imm: int):
+        self.emit(encode("XORI", rd, rs1, imm))
+
+    def ori(self, rd: int, rs1: int, imm: int):
+        self.emit(encode("ORI", rd, rs1, imm))
+
+    def andi(self, rd: int, rs1: int, imm: int):
+        self.emit(encode("ANDI", rd, rs1, imm))
+
+    def lw(self, rd: int, rs1: int, imm: int):
+        self.emit(encode("LW", rd, rs1, imm))
+
+    # S-type
+    def sw(self, rs2: int, rs1: int, imm: int):
+        # store rs2 at rs1 + imm
+        self.emit(encode("SW", rs2, rs1, imm))
+
+    # B / J-type, target is a label or a byte offset from the instruction
+    def _control(self, mnemonic: str, registers: tuple, target):
+        if isinstance(target, str):
+            self.fixups.append((len(self.words), mnemonic, registers, target))
+            self.words.append(None)
+        else:
+            self.words.append(self._encode_control(mnemonic, registers, target))
+
+    @staticmethod
+    def _encode_control(mnemonic: str, registers: tuple, offset: int) -> int:
+        return encode(mnemonic, *registers, offset)
+
+    def beq(self, rs1: int, rs2: int, target):
+        self._control("beq", (rs1, rs2), target)
+
+    def bne(self, rs1: int, rs2: int, target):
+        self._control("bne", (rs1, rs2), target)
+
+    def jal(self, rd: int, target):
+        self._control("jal", (rd,), target)
+
+    def halt(self):
+        self.emit(encode("HALT"))
+
+    # pseudo instructions
+    def nop(self):
+        self.addi(0, 0, 0)
+
+    def load_constant(self, rd: int, value: int):
+        # rd = value with the supported subset (no LUI / shifts): ADDI for 12-bit values, otherwise the
+        # value is built from its most significant bits by doubling (ADD rd, rd, rd) and adding the next bit
+        if -2048 <= value < 2048:
+            self.addi(rd, 0, value)
+            return
+        if not 0 <= value < (1 << 31):
+            raise Exception(f"Constant out of range: {value}")
+        bits = value.bit_length()
+        head_bits = 11
+        self.addi(rd, 0, value >> (bits - head_bits))
+        for position in range(bits - head_bits - 1, -1, -1):
+            self.add(rd, rd, rd)
+            if (value >> position) & 1:
+                self.addi(rd, rd, 1)
+
+    def data_words(self, words, address: int = None):
+        # store words in the initial data memory, from address (word aligned) or after the current data
+        index = len(self.data) if address is None else address // 4
+        if address is not None and address % 4:
+            raise Exception(f"Unaligned data address: {address}")
+        if index > len(self.data):
+            self.data.extend([0] * (index - len(self.data)))
+        for offset, word in enumerate(words):
+            if index + offset < len(self.data):
+                self.data[index + offset] = word & 0xffffffff
+            else:
+                self.data.append(word & 0xffffffff)
+
+    def build(self) -> list:
+        # instruction words with every label resolved
+        words = list(self.words)
+        for index, mnemonic, registers, label in self.fixups:
+            if label not in self.labels:
+                raise Exception(f"Undefined label: {label}")
+            words[index] = self._encode_control(mnemonic, registers, self.labels[label] - index * 4)
+        return words
+
+    def write(self, io_dir: str):
+        # imem.txt / dmem.txt in io_dir
+        os.makedirs(io_dir, exist_ok=True)
+        with open(os.path.join(io_dir, "imem.txt"), "w") as file:
+            file.write("\n".join(write_bytes(self.build())))
+        with open(os.path.join(io_dir, "dmem.txt"), "w") as file:
+            file.write("\n".join(write_bytes(self.data or [0])))
+
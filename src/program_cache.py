@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import struct
+from typing import NamedTuple, Optional
+
+# Packed cache of loaded program / data images. The first run on an input writes <input>.cache next to it (or
+# <digest>.<kind>.cache in $RV32I_CACHE_DIR, shared by every copy of the same input) holding the loaded bytes and,
+# for programs, the predecoded instruction records. Later runs load that instead of parsing the text and decoding
+# every instruction again. The cache is keyed by the sha256 of the input file, so editing the input invalidates it.
+# RV32I_PROGRAM_CACHE=0 disables it. Packed .bin inputs are memory mapped and never cached.
+#
+# File layout: header struct, JSON index, segment bytes, records (struct RECORD each).
+
+CACHE_VERSION = 2  # bump when the layout or the decoding of the records changes
+MAGIC = b"RVPC"
+HEADER = struct.Struct("<4sHB1x32sI")  # magic, version, kind, source sha256, JSON index length
+RECORD = struct.Struct("<IBBBBi")  # word, mnemonic index, rd, rs1, rs2, imm
+KINDS = {"imem": 0, "dmem": 1}
+
+
+class CachedImage(NamedTuple):
+    segments: list  # (address, bytearray) of the loaded image
+    records: Optional[list]  # (word, mnemonic, rd, rs1, rs2, imm) of every instruction word, None for data
+
+
+def enabled() -> bool:
+    return os.environ.get("RV32I_PROGRAM_CACHE", "1") != "0"
+
+
+def cacheable(source: str) -> bool:
+    return enabled() and os.path.splitext(source)[1].lower() != ".bin" and os.path.exists(source)
+
+
+def file_digest(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def cache_path(source: str, kind: str, digest: bytes) -> str:
+    cache_dir = os.environ.get("RV32I_CACHE_DIR")
+    if cache_dir:
+        return os.path.join(cache_dir, f"{digest.hex()}.{kind}.cache")
+    return source + ".cache"
+
+
+def load(source: str, kind: str):
+    # (source digest, CachedImage) - the digest is None when source is not cached, the image None on a miss
+    if not cacheable(source):
+        return None, None
+    digest = file_digest(source)
+    try:
+        with open(cache_path(source, kind, digest), "rb") as file:
+            data = file.read()
+    except OSError:
+        return digest, None
+    if len(data) < HEADER.size:
+        return digest, None
+    magic, version, kind_id, source_digest, index_size = HEADER.unpack_from(data)
+    if magic != MAGIC or version != CACHE_VERSION or kind_id != KINDS[kind] or source_digest != digest:
+        return digest, None
+
+    position = HEADER.size + index_size
+    index = json.loads(data[HEADER.size: position])
+    segments = []
+    for address, size in index["segments"]:
+        segments.append((address, bytearray(data[position: position + size])))
+        position += size
+    records = None
+    if index["mnemonics"] is not None:
+        mnemonics = index["mnemonics"]
+        records = [(word, mnemonics[mnemonic], rd, rs1, rs2, imm)
+                   for word, mnemonic, rd, rs1, rs2, imm in RECORD.iter_unpack(data[position:])]
+    return digest, CachedImage(segments, records)
+
+
+def store(source: str, kind: str, digest: bytes, segments, records=None):
+    # write the cache of source, best effort: an unwritable location only costs the next run a parse
+    if digest is None:
+        return
+    mnemonics = None
+    packed = b""
+    if records is not None:
+        mnemonics = sorted({record[1] for record in records})
+        numbers = {mnemonic: number for number, mnemonic in enumerate(mnemonics)}
+        packed = b"".join(RECORD.pack(word, numbers[mnemonic], rd, rs1, rs2, imm)
+                          for word, mnemonic, rd, rs1, rs2, imm in records)
+    index = json.dumps({"segments": [[address, len(image)] for address, image in segments],
+                        "mnemonics": mnemonics}).encode()
+    path = cache_path(source, kind, digest)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as file:
+            file.write(HEADER.pack(MAGIC, CACHE_VERSION, KINDS[kind], digest, len(index)))
+            file.write(index)
+            for _, image in segments:
+                file.write(image)
+            file.write(packed)
+        # concurrent runs on the same input replace the file atomically
+        os.replace(temporary, path)
+    except OSError:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Batch regression runner
+Discovers every test directory (a directory holding imem.txt and dmem.txt), simulates it with both
+cores on a process pool and compares the seven result files with the expected ones in <test>/Result/
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from runner import run_core, write_performance_metrics
+
+# simulator output file -> expected file name(s) in the Result/ folder
+RESULT_FILES = {
+    "FS_DMEMResult.txt": ["FS_DMEMResult.txt"],
+    "FS_RFResult.txt": ["FS_RFResult.txt"],
+    "SS_DMEMResult.txt": ["SS_DMEMResult.txt"],
+    "SS_RFResult.txt": ["SS_RFResult.txt"],
+    "StateResult_FS.txt": ["StateResult_FS.txt"],
+    "StateResult_SS.txt": ["StateResult_SS.txt"],
+    "PerformanceMetrics_Result.txt": ["PerformanceMetrics_Result.txt", "PerformanceMetrics.txt"],
+}
+
+
+def discover_tests(roots):
+    # every directory below roots containing both imem.txt and dmem.txt, sorted by path
+    tests = []
+    for root in roots:
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names.sort()
+            if "imem.txt" in file_names and "dmem.txt" in file_names:
+                tests.append(os.path.abspath(dir_path))
+    return sorted(set(tests))
+
+
+def compare_files(generated_path, expected_path):
+    # None when equal (ignoring trailing whitespace on each line), else a one line description
+    with open(generated_path) as f1:
+        generated = [line.rstrip() for line in f1]
+    with open(expected_path) as f2:
+        expected = [line.rstrip() for line in f2]
+
+    for i, (line1, line2) in enumerate(zip(generated, expected)):
+        if line1 != line2:
+            return f"line {i + 1}: generated '{line1}' expected '{line2}'"
+    if len(generated) != len(expected):
+        return f"{len(generated)} lines generated, {len(expected)} expected"
+    return None
+
+
+def run_test(test_dir, output_dir=None):
+    # Simulate one test directory in a scratch copy and compare with its Result/ folder.
+    # Returns (test_dir, status, wall time, {result file: difference}) - status is PASS, FAIL, NO-RESULT or ERROR
+    start = time.perf_counter()
+    work_dir = output_dir if output_dir is not None else tempfile.mkdtemp(prefix="rv32i_")
+    os.makedirs(work_dir, exist_ok=True)
+    differences = {}
+    try:
+        shutil.copy(os.path.join(test_dir, "imem.txt"), work_dir)
+        shutil.copy(os.path.join(test_dir, "dmem.txt"), work_dir)
+        # InsMem prints its input path, which would interleave with the summary
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics = [run_core(stages, work_dir) for stages in ("SS", "FS")]
+        write_performance_metrics(work_dir, metrics)
+
+        expected_dir = os.path.join(test_dir, "Result")
+        if not os.path.isdir(expected_dir):
+            return test_dir, "NO-RESULT", time.perf_counter() - start, differences
+
+        for generated, candidates in RESULT_FILES.items():
+            expected = [os.path.join(expected_dir, name) for name in candidates
+                        if os.path.isfile(os.path.join(expected_dir, name))]
+            if not expected:
+                differences[generated] = "expected file missing"
+                continue
+            difference = compare_files(os.path.join(work_dir, generated), expected[0])
+            if difference is not None:
+                differences[generated] = difference
+        status = "FAIL" if differences else "PASS"
+    except Exception as e:
+        differences["simulation"] = f"{type(e).__name__}: {e}"
+        status = "ERROR"
+    finally:
+        if output_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return test_dir, status, time.perf_counter() - start, differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RV32I batch regression runner')
+    parser.add_argument("roots", nargs="*", default=[os.path.join(os.path.dirname(__file__), "..", "submissions", "Test")],
+                        help="Directories searched recursively for tests (default: submissions/Test).")
+    parser.add_argument("-j", "--jobs", default=os.cpu_count(), type=int, help="Number of worker processes.")
+    parser.add_argument("--keep", default="", type=str,
+                        help="Keep the generated files in <KEEP>/<test path below the roots> instead of a temporary "
+                             "directory.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the first difference of every file.")
+    args = parser.parse_args()
+
+    tests = discover_tests(args.roots)
+    if not tests:
+        print("No test directories found")
+        return 1
+
+    # tests are named by their path below the common root, unique even when directory names repeat
+    common = os.path.commonpath(tests) if len(tests) > 1 else os.path.dirname(tests[0])
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = []
+        for test_dir in tests:
+            output_dir = os.path.join(os.path.abspath(args.keep), os.path.relpath(test_dir, common)) \
+                if args.keep else None
+            futures.append(executor.submit(run_test, test_dir, output_dir))
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for test_dir, status, wall_time, differences in results:
+        counts[status] = counts.get(status, 0) + 1
+        detail = "" if not differences else " - " + ", ".join(sorted(differences))
+        print(f"{status:9s} {wall_time:8.3f} s  {os.path.relpath(test_dir, common)}{detail}")
+        if args.verbose:
+            for name, difference in sorted(differences.items()):
+                print(f"{'':22s}{name}: {difference}")
+
+    print("=" * 80)
+    print(f"{len(results)} tests in {elapsed:.3f} s: " + ", ".join(f"{count} {status}" for status, count in
+                                                               sorted(counts.items())))
+    return 0 if counts.get("PASS", 0) + counts.get("NO-RESULT", 0) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
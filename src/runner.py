@@ -0,0 +1,69 @@
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from branch_predictor import make_predictor, DEFAULT_BTB_ENTRIES
+from checkpoint import CheckpointSchedule, restore_any
+from models import DataMem, InsMem, MemSize
+from rv32i import SingleStageCore, FiveStageCore
+from tracing import TraceWriter, DEFAULT_BUFFER_SIZE
+
+CORES = {
+    "SS": SingleStageCore,
+    "FS": FiveStageCore,
+}
+
+
+def run_core(stages: str, io_dir: str, mem_size: int = MemSize, dmem_dump: str = "compat", trace_policy=None,
+             trace_buffer: int = DEFAULT_BUFFER_SIZE, predictor: str = "not-taken",
+             btb_entries: int = DEFAULT_BTB_ENTRIES, icache=None, dcache=None, checkpoint_cycles=(),
+             checkpoint_instructions=(), restore=(), profile: bool = False) -> str:
+    # Run one core ("SS" or "FS") on io_dir to completion on its own: loads imem / dmem, writes the
+    # DMEM dump, RF / state traces and counters of that core and returns its performance metrics text.
+    # Top level function so it can be executed in a worker process, the FS branch predictor is built here from its name
+    # and the FS caches from their CacheConfig. restore lists checkpoint files to resume from (see checkpoint.restore_any),
+    # checkpoints are saved at checkpoint_cycles / checkpoint_instructions.
+    imem = InsMem("Imem", io_dir)
+    dmem = DataMem(stages, io_dir, mem_size=mem_size)
+    trace_writer = functools.partial(TraceWriter, buffer_size=trace_buffer)
+    if stages == "FS":
+        core = FiveStageCore(io_dir, imem, dmem, trace_writer, trace_policy, make_predictor(predictor, btb_entries),
+                             icache, dcache)
+    else:
+        # translated blocks run several cycles per step, keep single cycles when checkpoints are due
+        core = SingleStageCore(io_dir, imem, dmem, trace_writer, trace_policy,
+                               translate=not (checkpoint_cycles or checkpoint_instructions))
+
+    if restore:
+        restore_any(core, restore)
+    if profile:
+        core.enable_profiling()
+    schedule = CheckpointSchedule(core.ioDir, checkpoint_cycles, checkpoint_instructions)
+
+    try:
+        while not core.halted:
+            core.step()
+            if schedule:
+                schedule.after_step(core)
+    finally:
+        core.close_traces()
+
+    dmem.output_data_mem(dmem_dump)
+    core.output_counters()
+    return core.performance_metrics()
+
+
+def write_performance_metrics(io_dir: str, metrics):
+    # metrics of every core, in SS, FS order, merged into the single PerformanceMetrics_Result.txt
+    with open(os.path.join(io_dir, "PerformanceMetrics_Result.txt"), "w") as file:
+        file.writelines(metrics)
+
+
+def run_parallel(io_dir: str, **options):
+    # SS and FS only share the read-only instruction memory, so each one runs to completion in its own
+    # process - wall time is that of the slower core instead of the sum of both
+    with ProcessPoolExecutor(max_workers=len(CORES)) as executor:
+        futures = [executor.submit(run_core, stages, io_dir, **options) for stages in CORES]
+        metrics = [future.result() for future in futures]
+
+    write_performance_metrics(io_dir, metrics)
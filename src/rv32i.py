@@ -1,19 +1,18 @@
-import copy
-
-from riscvmodel.code import decode, MachineDecodeError
-from riscvmodel.isa import Instruction
-
-from instructions import get_instruction_class, InstructionBase, ADDERBTYPE, ADDERJTYPE
-from models import InsMem, DataMem, RegisterFile, State
-
-# memory size, in reality, the memory size should be 2^32, but for this lab, for the space reason
-# we keep it as this large number, but the memory is still 32-bit addressable.
-MemSize = 1000
+from blocks import BlockCache, TranslatedBlock
+from branch_predictor import BranchPredictor, StaticNotTaken
+from cache import Cache, CacheConfig
+from counters import PerformanceCounters, BUBBLE_STAGES
+from instructions import InstructionBase, ADDERBTYPE, ADDERJTYPE
+from models import InsMem, DataMem, RegisterFile, State, DecodedInstruction
+from predecode import predecode
+from profiling import StageProfiler
+from tracing import TraceWriter, TracePolicy
 
 
 class Core(object):
-    def __init__(self, ioDir: str, imem: InsMem, dmem: DataMem):
-        self.myRF = RegisterFile(ioDir)
+    def __init__(self, ioDir: str, imem: InsMem, dmem: DataMem, trace_writer=TraceWriter, trace_policy=None):
+        self.myRF = RegisterFile(ioDir, trace_writer)
+        self.trace_policy: TracePolicy = trace_policy if trace_policy is not None else TracePolicy()
         self.cycle = 0
         self.halted = False
         self.ioDir = ioDir
@@ -23,8 +22,32 @@ class Core(object):
         self.nextState.nop_init()
         self.ext_imem: InsMem = imem
         self.ext_dmem: DataMem = dmem
+        self.program = predecode(imem)  # decoded once, shared with the other core through imem
+        self.counters: PerformanceCounters = None  # cycle level event counters, five stage core only
+        self.profiler: StageProfiler = None  # per section wall time of step(), see enable_profiling()
+
+    def enable_profiling(self):
+        # time the sections of every step from now on, the report is written when the core halts
+        self.profiler = StageProfiler(self.stages)
+
+    def output_profile(self):
+        # <ioDir>Profile.txt / .json, e.g. FS_Profile.txt
+        if self.profiler is not None:
+            self.profiler.write(self.ioDir)
+
+    def close_traces(self):
+        # flush and close the RF and state trace files - called on halt, and on errors by the caller
+        self.myRF.trace.close()
+        self.state_trace.close()
+
+    def end_cycle(self):
+        # Double buffered latches: the State filled in during this cycle becomes the current one and the
+        # previous current State is reused as nextState, starting from a field-by-field copy of the new values
+        self.state, self.nextState = self.nextState, self.state
+        self.nextState.copy_from(self.state)
+        self.cycle += 1
 
-    def calculate_performance_metrics(self):
+    def performance_metrics(self) -> str:
         cpi = float(self.cycle) / self.state.IF.instruction_count
         ipc = 1 / cpi
 
@@ -32,82 +55,171 @@ class Core(object):
                         f"Number of cycles taken: {self.cycle}\n" \
                         f"Cycles per instruction: {cpi}\n" \
                         f"Instructions per cycle: {ipc}\n"
+        return result_format
+
+    def output_counters(self):
+        # structured counters as JSON next to PerformanceMetrics_Result.txt, e.g. FS_PerformanceCounters.json
+        if self.counters is not None:
+            self.counters.write_json(self.ioDir + "PerformanceCounters.json")
 
+    def calculate_performance_metrics(self):
         write_mode = "w" if self.stages == "Single Stage" else "a"
 
         with open(self.ioDir[:-3] + "PerformanceMetrics_Result.txt", write_mode) as file:
-            file.write(result_format)
+            file.write(self.performance_metrics())
 
 
 class SingleStageCore(Core):
-    def __init__(self, io_dir: str, imem: InsMem, dmem: DataMem):
-        super(SingleStageCore, self).__init__(io_dir + "/SS_", imem, dmem)
+    def __init__(self, io_dir: str, imem: InsMem, dmem: DataMem, trace_writer=TraceWriter, trace_policy=None,
+                 translate: bool = True):
+        super(SingleStageCore, self).__init__(io_dir + "/SS_", imem, dmem, trace_writer, trace_policy)
         self.opFilePath = io_dir + "/StateResult_SS.txt"
+        self.state_trace = trace_writer(self.opFilePath)
         self.stages = "Single Stage"
+        # basic blocks compiled to Python functions, one step() then runs a whole block. Only when no per cycle
+        # trace is needed (trace level none / final) and the caller does not need to stop at a given cycle.
+        translate = translate and self.trace_policy.level in ("none", "final")
+        self.blocks = BlockCache(self.program) if translate else None
+
+    def run_block(self, block: TranslatedBlock):
+        # block.length cycles at once: same registers, memory, PC and counts as stepping them one by one
+        self.state.IF.PC = block.function(self.myRF.registers, self.ext_dmem.read_data, self.ext_dmem.write_data_mem)
+        self.state.IF.instruction_count += block.length
+        self.cycle += block.length
+        self.nextState.copy_from(self.state)
 
     def step(self):
+        profiler = self.profiler
+        if profiler:
+            profiler.start()
+        if self.blocks is not None:
+            block = self.blocks.lookup(self.state.IF.PC)
+            if block is not None:
+                self.run_block(block)
+                if profiler:
+                    profiler.lap("block")
+                return
+
         # IF
-        instruction_bytes = self.ext_imem.read_instr(self.state.IF.PC)
-        if instruction_bytes == "1" * 32:
+        instruction: DecodedInstruction = self.program.fetch(self.state.IF.PC)
+        if instruction.is_halt:
             self.nextState.IF.nop = True
         else:
             self.nextState.IF.PC += 4
             self.nextState.IF.instruction_count = self.nextState.IF.instruction_count + 1
-
-        try:
-            # ID
-            instruction: Instruction = decode(int(instruction_bytes, 2))
-            if instruction.mnemonic in ['beq', 'bne']:
-                self.nextState.IF.PC = ADDERBTYPE(instruction, self.state, self.myRF).get_pc()
-            elif instruction.mnemonic == 'jal':
-                self.nextState.IF.PC = ADDERJTYPE(instruction, self.state, self.myRF).get_pc()
-            else:
-                instruction_ob: InstructionBase = get_instruction_class(instruction.mnemonic)(instruction,
-                                                                                              self.ext_dmem, self.myRF,
-                                                                                              self.state,
-                                                                                              self.nextState)
-                # Ex
-                alu_result = instruction_ob.execute()
-                # Load/Store (MEM)
-                mem_result = instruction_ob.mem(alu_result=alu_result)
-                # WB
-                wb_result = instruction_ob.wb(mem_result=mem_result, alu_result=alu_result)
-        except MachineDecodeError as e:
-            if "{:08x}".format(e.word) == 'ffffffff':
-                pass
-            else:
-                raise Exception("Invalid Instruction to Decode")
+        if profiler:
+            profiler.lap("IF")
+
+        # ID
+        if instruction.is_halt:
+            if profiler:
+                profiler.lap("ID")
+        elif instruction.mnemonic == "invalid":
+            raise Exception("Invalid Instruction to Decode")
+        elif instruction.mnemonic in ['beq', 'bne']:
+            self.nextState.IF.PC = ADDERBTYPE(instruction, self.state, self.myRF).get_pc()
+            if profiler:
+                profiler.lap("ID")
+        elif instruction.mnemonic == 'jal':
+            self.nextState.IF.PC = ADDERJTYPE(instruction, self.state, self.myRF).get_pc()
+            if profiler:
+                profiler.lap("ID")
+        else:
+            if instruction.handler is None:
+                raise Exception("Invalid Instruction")
+            instruction_ob: InstructionBase = instruction.handler(instruction, self.ext_dmem, self.myRF,
+                                                                  self.state, self.nextState)
+            if profiler:
+                profiler.lap("ID")
+            # Ex
+            alu_result = instruction_ob.execute()
+            if profiler:
+                profiler.lap("EX")
+            # Load/Store (MEM)
+            mem_result = instruction_ob.mem(alu_result=alu_result)
+            if profiler:
+                profiler.lap("MEM")
+            # WB
+            wb_result = instruction_ob.wb(mem_result=mem_result, alu_result=alu_result)
+            if profiler:
+                profiler.lap("WB")
         # self.halted = True
         if self.state.IF.nop:
             self.nextState.IF.instruction_count = self.nextState.IF.instruction_count + 1
             self.halted = True
 
-        self.myRF.output_rf(self.cycle)  # dump RF
-        self.printState(self.nextState, self.cycle)  # print states after executing cycle 0, cycle 1, cycle 2 ...
+        if self.trace_policy.wants(self.cycle, self.halted):
+            self.myRF.output_rf(self.cycle)  # dump RF
+            self.printState(self.nextState, self.cycle)  # print states after executing cycle 0, cycle 1, cycle 2 ...
+        if self.halted:
+            self.close_traces()
+        if profiler:
+            profiler.lap("trace")
 
         # The end of the cycle and updates the current state with the values calculated in this cycle
-        self.state = copy.deepcopy(self.nextState)
-        # self.nextState = copy.deepcopy(self.nextState)
-        self.cycle += 1
+        self.end_cycle()
+        if profiler:
+            profiler.lap("latch")
+            if self.halted:
+                self.output_profile()
 
     def printState(self, state, cycle):
         printstate = ["-" * 70 + "\n", "State after executing cycle: " + str(cycle) + "\n"]
         printstate.append("IF.PC: " + str(state.IF.PC) + "\n")
         printstate.append("IF.nop: " + str(state.IF.nop) + "\n")
-
-        if (cycle == 0):
-            perm = "w"
-        else:
-            perm = "a"
-        with open(self.opFilePath, perm, encoding='utf-8') as wf:
-            wf.writelines(printstate)
+        self.state_trace.writelines(printstate)
 
 
 class FiveStageCore(Core):
-    def __init__(self, ioDir, imem, dmem):
-        super(FiveStageCore, self).__init__(ioDir + "/FS_", imem, dmem)
+    def __init__(self, ioDir, imem, dmem, trace_writer=TraceWriter, trace_policy=None, predictor=None,
+                 icache=None, dcache=None):
+        super(FiveStageCore, self).__init__(ioDir + "/FS_", imem, dmem, trace_writer, trace_policy)
         self.opFilePath = ioDir + "/StateResult_FS.txt"
+        self.state_trace = trace_writer(self.opFilePath)
         self.stages = "Five Stage"
+        self.counters = PerformanceCounters()
+        self.predictor: BranchPredictor = predictor if predictor is not None else StaticNotTaken()
+        self.counters.predictor = self.predictor.name
+        # optional L1 caches in front of InsMem (IF) and DataMem (MEM), None is an ideal one cycle memory.
+        # A Cache object (e.g. one warmed up by sampling.py) is used as is, a CacheConfig builds a cold one.
+        self.icache = Cache("I-cache", icache) if isinstance(icache, CacheConfig) else icache
+        self.dcache = Cache("D-cache", dcache) if isinstance(dcache, CacheConfig) else dcache
+        for name, cache in (("icache", self.icache), ("dcache", self.dcache)):
+            if cache is not None:
+                self.counters.caches[name] = cache
+        self.pending_stall = None  # remaining frozen cycles of the memory accesses of the current cycle
+
+    def performance_metrics(self) -> str:
+        metrics = super(FiveStageCore, self).performance_metrics()
+        if self.counters.caches:
+            for cache in self.counters.caches.values():
+                metrics += cache.metrics()
+            metrics += f"Memory stall cycles: {self.counters.memory_stalls}\n"
+        return metrics
+
+    def memory_stall(self) -> bool:
+        # Probe the caches with the accesses of this cycle (IF fetch, MEM load / store) the first time the cycle
+        # is attempted. While the slower access is outstanding the whole pipeline is frozen: nothing moves,
+        # the traces show the unchanged state. Returns True for a frozen cycle.
+        if self.pending_stall is None:
+            latency = 1
+            if self.icache is not None and not self.state.IF.nop:
+                latency = self.icache.access(self.state.IF.PC)
+            if self.dcache is not None and not self.state.MEM.nop and (
+                    self.state.MEM.read_data_mem or self.state.MEM.write_data_mem):
+                latency = max(latency, self.dcache.access(self.state.MEM.data_address, self.state.MEM.write_data_mem))
+            self.pending_stall = latency - 1
+        if self.pending_stall == 0:
+            self.pending_stall = None
+            return False
+
+        self.pending_stall -= 1
+        self.counters.memory_stalls += 1
+        if self.trace_policy.wants(self.cycle, False):
+            self.myRF.output_rf(self.cycle)
+            self.printState(self.nextState, self.cycle)
+        self.end_cycle()
+        return True
 
     def print_current_instruction(self, cycle, stage, instruction):
         return
@@ -124,10 +236,25 @@ class FiveStageCore(Core):
 
     def step(self):
         # Your implementation
+        profiler = self.profiler
+        if profiler:
+            profiler.start()
+
+        self.counters.cycles += 1
+        for stage in BUBBLE_STAGES:
+            if getattr(self.state, stage).nop:
+                self.counters.bubbles[stage] += 1
+        if self.counters.caches and self.memory_stall():
+            if profiler:
+                profiler.lap("stall")
+            return
+        if profiler:
+            profiler.lap("counters")
 
         # --------------------- WB stage ----------------------
         if not self.state.WB.nop:
             self.print_current_instruction(self.cycle, "WB", self.state.WB.instruction_ob.instruction)
+            self.counters.retire(self.state.WB.instruction_ob.instruction.mnemonic)
 
             self.state, self.nextState, self.ext_dmem, self.myRF, _ = self.state.WB.instruction_ob.wb(
                 state=self.state,
@@ -137,6 +264,9 @@ class FiveStageCore(Core):
         else:
             self.print_current_instruction(self.cycle, "WB", "nop")
 
+        if profiler:
+            profiler.lap("WB")
+
         # --------------------- MEM stage ---------------------
         if not self.state.MEM.nop:
             self.print_current_instruction(self.cycle, "MEM", self.state.MEM.instruction_ob.instruction)
@@ -148,8 +278,7 @@ class FiveStageCore(Core):
                 memory=self.ext_dmem)
         else:
             # MEM nop - retain WB values from previous cycle
-            from models import WBState
-            wb_state = WBState()
+            wb_state = self.nextState.reset_latch("WB")
             wb_state.nop = True
             # Retain values from current WB (previous cycle's values)
             wb_state.store_data = self.state.WB.store_data
@@ -157,9 +286,11 @@ class FiveStageCore(Core):
             wb_state.rs1 = self.state.WB.rs1
             wb_state.rs2 = self.state.WB.rs2
             wb_state.write_back_enable = self.state.WB.write_back_enable
-            self.nextState.WB = wb_state
             self.print_current_instruction(self.cycle, "MEM", "nop")
 
+        if profiler:
+            profiler.lap("MEM")
+
         # --------------------- EX stage ----------------------
         if not self.state.EX.nop:
             self.print_current_instruction(self.cycle, "EX", self.state.EX.instruction_ob.instruction)
@@ -168,8 +299,7 @@ class FiveStageCore(Core):
                 state=self.state, nextState=self.nextState, registers=self.myRF, memory=self.ext_dmem)
         else:
             # NOP in EX: retain MEM control signals from previous cycle
-            from models import MEMState
-            mem_state = MEMState()
+            mem_state = self.nextState.reset_latch("MEM")
             mem_state.nop = True
             # Retain control signals from current MEM (previous cycle's values)
             mem_state.write_register_addr = self.state.MEM.write_register_addr
@@ -182,37 +312,38 @@ class FiveStageCore(Core):
             mem_state.alu_result = self.state.MEM.alu_result
             mem_state.store_data = self.state.MEM.store_data
             mem_state.data_address = self.state.MEM.data_address
-            self.nextState.MEM = mem_state
             self.print_current_instruction(self.cycle, "EX", "nop")
 
+        if profiler:
+            profiler.lap("EX")
+
         # --------------------- ID stage ----------------------
         # Always decode if there's a valid instruction, even if ID.nop is True
         # This allows instructions to continue flowing through pipeline after HALT
         if self.state.ID.instruction_bytes and self.state.ID.instruction_bytes != "":
             self.print_current_instruction(self.cycle, "ID", self.state.ID.instruction_bytes)
-            try:
-                instruction = decode(int(self.state.ID.instruction_bytes, 2))
-                instruction_ob: InstructionBase = get_instruction_class(instruction.mnemonic)(instruction,
-                                                                                              self.ext_dmem,
-                                                                                              self.myRF,
-                                                                                              self.state,
-                                                                                              self.nextState)
+            instruction: DecodedInstruction = self.program.fetch(self.state.ID.PC)
+            if instruction.is_halt:
+                self.nextState.ID.halt = True
+            elif instruction.mnemonic == "invalid":
+                raise Exception("Invalid Instruction to Decode")
+            else:
+                if instruction.handler is None:
+                    raise Exception("Invalid Instruction")
+                instruction_ob: InstructionBase = instruction.handler(instruction, self.ext_dmem, self.myRF,
+                                                                      self.state, self.nextState)
                 self.state, self.nextState, self.ext_dmem, self.myRF, _ = instruction_ob.decode(state=self.state,
                                                                                                 nextState=self.nextState,
                                                                                                 registers=self.myRF,
-                                                                                                memory=self.ext_dmem)
+                                                                                                memory=self.ext_dmem,
+                                                                                                counters=self.counters,
+                                                                                                predictor=self.predictor)
                 # If ID was marked as nop, propagate nop to EX
                 if self.state.ID.nop:
                     self.nextState.EX.nop = True
-            except MachineDecodeError as e:
-                if "{:08x}".format(e.word) == 'ffffffff':
-                    self.nextState.ID.halt = True
-                else:
-                    raise Exception("Invalid Instruction to Decode")
         else:
             # No valid instruction - create EX NOP that retains previous cycle's values
-            from models import EXState
-            ex_state = EXState()
+            ex_state = self.nextState.reset_latch("EX")
             ex_state.nop = True
             ex_state.instr_binary = self.state.EX.instr_binary
             ex_state.operand1 = self.state.EX.operand1
@@ -225,9 +356,11 @@ class FiveStageCore(Core):
             ex_state.read_data_mem = self.state.EX.read_data_mem
             ex_state.write_data_mem = self.state.EX.write_data_mem
             ex_state.write_back_enable = self.state.EX.write_back_enable
-            self.nextState.EX = ex_state
             self.print_current_instruction(self.cycle, "ID", "nop")
 
+        if profiler:
+            profiler.lap("ID")
+
         # --------------------- IF stage ----------------------
         if not self.state.IF.nop:
             # Check if ID stage already set nextState.ID (e.g., branch flush)
@@ -240,53 +373,67 @@ class FiveStageCore(Core):
                 self.nextState.IF.PC = self.nextState.IF.PC  # Keep the PC set by branch
                 self.print_current_instruction(self.cycle, "IF", "flushed by branch")
             else:
-                instruction_bytes = self.ext_imem.read_instr(self.state.IF.PC)
-                if instruction_bytes == "1" * 32:
+                instruction: DecodedInstruction = self.program.fetch(self.state.IF.PC)
+                if instruction.is_halt:
                     # HALT detected - don't update ID with HALT, preserve current ID instruction
                     self.nextState.ID.nop = True
                     self.nextState.IF.nop = True
                     self.nextState.ID.instruction_bytes = self.state.ID.instruction_bytes
+                    self.nextState.ID.PC = self.state.ID.PC
+                    self.nextState.ID.predicted_taken = self.state.ID.predicted_taken
+                    self.nextState.ID.predicted_target = self.state.ID.predicted_target
                     self.print_current_instruction(self.cycle, "IF", "Halt")
                 else:
                     # Normal instruction - update ID
-                    self.nextState.ID.instruction_bytes = instruction_bytes
+                    self.nextState.ID.instruction_bytes = instruction.bits
+                    self.nextState.ID.PC = self.state.IF.PC
                     self.nextState.ID.nop = False
-                    self.nextState.IF.PC = self.state.IF.PC + 4
+                    # fetch the predicted target next, pc + 4 when not predicted taken
+                    predicted_pc = self.predictor.predict(self.state.IF.PC)
+                    self.nextState.ID.predicted_taken = predicted_pc is not None
+                    self.nextState.ID.predicted_target = predicted_pc if predicted_pc is not None else 0
+                    self.nextState.IF.PC = predicted_pc if predicted_pc is not None else self.state.IF.PC + 4
                     self.nextState.IF.instruction_count = self.nextState.IF.instruction_count + 1
-                    self.print_current_instruction(self.cycle, "IF", instruction_bytes)
+                    self.print_current_instruction(self.cycle, "IF", instruction.bits)
         else:
             # IF is nop - preserve ID instruction from previous cycle
-            from models import IDState
-            id_state = IDState()
+            id_state = self.nextState.reset_latch("ID")
             id_state.nop = True
             id_state.instruction_bytes = self.state.ID.instruction_bytes
-            self.nextState.ID = id_state
+            id_state.PC = self.state.ID.PC
             self.print_current_instruction(self.cycle, "IF", "nop")
 
+        if profiler:
+            profiler.lap("IF")
+
         if (self.state.IF.halt or self.state.IF.nop) and (self.state.ID.halt or self.state.ID.nop) and (
                 self.state.EX.halt or self.state.EX.nop) and (self.state.MEM.halt or self.state.MEM.nop) and (
                 self.state.WB.halt or self.state.WB.nop):
             self.nextState.IF.instruction_count = self.state.IF.instruction_count + 1
             self.halted = True
             self.print_current_instruction(self.cycle, "--", "End of Simulation")
-
-        self.myRF.output_rf(self.cycle)  # dump RF
-        self.printState(self.nextState, self.cycle)  # print states after executing cycle 0, cycle 1, cycle 2 ...
-
-        self.state = copy.deepcopy(self.nextState)
-        self.cycle += 1
+        if profiler:
+            profiler.lap("halt")
+
+        if self.trace_policy.wants(self.cycle, self.halted):
+            self.myRF.output_rf(self.cycle)  # dump RF
+            self.printState(self.nextState, self.cycle)  # print states after executing cycle 0, cycle 1, cycle 2 ...
+        if self.halted:
+            self.close_traces()
+        if profiler:
+            profiler.lap("trace")
+
+        self.end_cycle()
+        if profiler:
+            profiler.lap("latch")
+            if self.halted:
+                self.output_profile()
 
     def printState(self, state, cycle):
         # Format to match desired output - single newline after cycle, not double
         print_state = "-" * 70 + "\n" + "State after executing cycle: " + str(cycle) + "\n"
         print_state += str(state) + "\n"
-
-        if (cycle == 0):
-            perm = "w"
-        else:
-            perm = "a"
-        with open(self.opFilePath, perm) as wf:
-            wf.write(print_state)
+        self.state_trace.write(print_state)
 
 
 if __name__ == "__main__":
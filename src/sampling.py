@@ -0,0 +1,215 @@
+import json
+import math
+import time
+
+from branch_predictor import BranchPredictor, make_predictor, DEFAULT_BTB_ENTRIES
+from cache import Cache
+from functional import FunctionalCore, OP_LW, OP_SW, OP_BEQ, OP_BNE, OP_JAL
+from models import InsMem, DataMem
+from rv32i import FiveStageCore
+from tracing import TracePolicy
+
+# Sampled simulation (SMARTS style systematic sampling) of the five stage core. The functional engine owns the
+# architectural state and runs the whole program. Every period it
+#   1. fast-forwards `skip` instructions functionally,
+#   2. runs `warmup` instructions functionally while training the branch predictor and the caches,
+#   3. simulates a detailed window on the five stage core starting from the functional state with an empty
+#      pipeline: the first `fill` retired instructions refill the pipeline and are not measured, the CPI of the
+#      next `detail` retired instructions is one sample,
+#   4. executes the window's instructions functionally, the detailed core worked on a copy of data memory.
+# The CPI estimate is the mean of the samples with a Student t 95% confidence interval.
+
+# two-sided 95% Student t quantiles for 1..30 degrees of freedom, the normal quantile above
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+        2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+Z_95 = 1.960
+
+
+def t_95(degrees_of_freedom: int) -> float:
+    if degrees_of_freedom < 1:
+        return math.inf
+    return T_95[degrees_of_freedom - 1] if degrees_of_freedom <= len(T_95) else Z_95
+
+
+class SamplingConfig(object):
+    # parsed from "skip=100000,warmup=2000,detail=1000,fill=5"
+
+    FIELDS = ("skip", "warmup", "detail", "fill")
+
+    def __init__(self, skip: int = 100000, warmup: int = 2000, detail: int = 1000, fill: int = 5):
+        if skip < 0 or warmup < 0 or detail < 1 or fill < 0:
+            raise ValueError(f"Invalid sampling parameters: skip={skip} warmup={warmup} detail={detail} fill={fill}")
+        self.skip = skip
+        self.warmup = warmup
+        self.detail = detail
+        self.fill = fill
+
+    @classmethod
+    def parse(cls, spec: str) -> "SamplingConfig":
+        options = {}
+        for item in filter(None, spec.split(",")):
+            key, sep, value = item.partition("=")
+            key = key.strip()
+            if not sep or key not in cls.FIELDS:
+                raise ValueError(f"Invalid sampling option: {item}")
+            options[key] = int(value, 0)
+        return cls(**options)
+
+    def __str__(self):
+        return ",".join(f"{key}={getattr(self, key)}" for key in self.FIELDS)
+
+
+class SampledSimulation(object):
+    def __init__(self, io_dir: str, imem: InsMem, dmem: DataMem, config: SamplingConfig,
+                 predictor: BranchPredictor = None, icache: Cache = None, dcache: Cache = None):
+        self.io_dir = io_dir
+        self.imem = imem
+        self.config = config
+        self.functional = FunctionalCore(imem, dmem)
+        self.predictor = predictor if predictor is not None else make_predictor("not-taken", DEFAULT_BTB_ENTRIES)
+        self.icache = icache
+        self.dcache = dcache
+        self.mem_size = dmem.size
+        # scratch data memory of the detailed windows, reloaded from the functional one for every window
+        self.window_dmem = DataMem("FS", io_dir, mem_size=self.mem_size)
+        self.samples = []  # CPI of every detailed window
+        self.detailed_cycles = 0  # cycles simulated by the five stage core, including pipeline fill
+        self.detailed_instructions = 0  # instructions measured by the samples
+        self.exhaustive = False  # no window was measured, the whole program was simulated in detail instead
+        self.elapsed = 0.0
+
+    def warm_up(self, count: int):
+        # execute count instructions functionally, feeding their fetches, loads / stores and branch outcomes
+        # to the caches and the branch predictor
+        core = self.functional
+        code = core.code
+        regs = core.registers
+        for _ in range(count):
+            if core.halted:
+                return
+            pc = core.pc
+            op, rd, rs1, rs2, imm = code[pc >> 2] if 0 <= pc >> 2 < len(code) else (None, 0, 0, 0, 0)
+            if self.icache is not None:
+                self.icache.access(pc)
+            if self.dcache is not None and op in (OP_LW, OP_SW):
+                self.dcache.access(regs[rs1] + imm, op == OP_SW)
+            core.run(1)
+            if op in (OP_BEQ, OP_BNE, OP_JAL):
+                self.predictor.resolve(pc, op != OP_JAL, core.pc != pc + 4, pc + imm)
+
+    def detailed_window(self):
+        # CPI of config.detail instructions on the five stage core, None if the program ends before any was measured
+        functional = self.functional
+        self.window_dmem.pages = {number: bytearray(page) for number, page in functional.dmem.pages.items()}
+        self.window_dmem.size = functional.dmem.size
+        core = FiveStageCore(self.io_dir, self.imem, self.window_dmem, trace_policy=TracePolicy("none"),
+                             predictor=self.predictor, icache=self.icache, dcache=self.dcache)
+        core.myRF.registers[:] = functional.registers
+        core.state.IF.PC = functional.pc
+        core.nextState.copy_from(core.state)
+
+        fill, detail = self.config.fill, self.config.detail
+        start_cycle = None
+        retired = 0
+        while not core.halted and retired < fill + detail:
+            if start_cycle is None and retired >= fill:
+                start_cycle = core.cycle
+            core.step()
+            retired = sum(core.counters.retired.values())
+        self.detailed_cycles += core.cycle
+        core.close_traces()
+
+        # the functional engine executes the window's instructions itself
+        functional.run(retired)
+        if start_cycle is None or retired <= fill:
+            return None
+        self.detailed_instructions += retired - fill
+        return (core.cycle - start_cycle) / (retired - fill)
+
+    def full_detail(self):
+        # CPI of the whole program on the five stage core with a cold predictor and cold caches, for programs that
+        # end before a window is measured (skip + warmup + fill longer than the program)
+        predictor = make_predictor(self.predictor.name, self.predictor.btb.entries)
+        icache = Cache(self.icache.name, self.icache.config) if self.icache is not None else None
+        dcache = Cache(self.dcache.name, self.dcache.config) if self.dcache is not None else None
+        core = FiveStageCore(self.io_dir, self.imem, DataMem("FS", self.io_dir, mem_size=self.mem_size),
+                             trace_policy=TracePolicy("none"), predictor=predictor, icache=icache, dcache=dcache)
+        while not core.halted:
+            core.step()
+        core.close_traces()
+        retired = sum(core.counters.retired.values())
+        self.detailed_cycles += core.cycle
+        self.detailed_instructions += retired
+        self.exhaustive = True
+        if retired:
+            self.samples.append(core.cycle / retired)
+
+    def run(self):
+        start = time.perf_counter()
+        functional = self.functional
+        while not functional.halted:
+            functional.run(self.config.skip)
+            self.warm_up(self.config.warmup)
+            if functional.halted:
+                break
+            cpi = self.detailed_window()
+            if cpi is not None:
+                self.samples.append(cpi)
+        if not self.samples:
+            self.full_detail()
+        self.elapsed = time.perf_counter() - start
+
+    def estimate(self) -> dict:
+        # None for the values the samples leave undefined (no sample, or one sample for the spread)
+        n = len(self.samples)
+        mean = sum(self.samples) / n if n else None
+        stddev = half_width = None
+        if self.exhaustive:
+            stddev = half_width = 0.0  # the whole program was simulated, no sampling error
+        elif n > 1:
+            stddev = math.sqrt(sum((cpi - mean) ** 2 for cpi in self.samples) / (n - 1))
+            half_width = t_95(n - 1) * stddev / math.sqrt(n)
+        # HALT is counted as an instruction by the functional engine, not by the pipeline
+        instructions = max(functional_instructions(self.functional), 0)
+        return {
+            "config": str(self.config),
+            "predictor": self.predictor.name,
+            "windows": 0 if self.exhaustive else n,
+            "exhaustive": self.exhaustive,
+            "instructions": instructions,
+            "detailed_instructions": self.detailed_instructions,
+            "detailed_cycles": self.detailed_cycles,
+            "cpi": mean,
+            "cpi_stddev": stddev,
+            "cpi_ci95": [mean - half_width, mean + half_width] if half_width is not None else None,
+            "estimated_cycles": mean * instructions if mean is not None else None,
+            "wall_time": self.elapsed,
+        }
+
+    def metrics(self) -> str:
+        estimate = self.estimate()
+        ci = estimate["cpi_ci95"]
+        windows = "whole program simulated in detail, no window fit" if estimate["exhaustive"] else \
+            f"{estimate['windows']} windows"
+        return f"Sampled Five Stage Core Performance Metrics-----------------------------\n" \
+               f"Sampling: {estimate['config']}, {windows}\n" \
+               f"Instructions: {estimate['instructions']}\n" \
+               f"Estimated number of cycles: {undefined_as_na(estimate['estimated_cycles'])}\n" \
+               f"Estimated cycles per instruction: {undefined_as_na(estimate['cpi'])}\n" \
+               f"95% confidence interval: {f'[{ci[0]}, {ci[1]}]' if ci is not None else 'n/a'}\n"
+
+    def output(self):
+        # FS_SampledPerformanceMetrics.txt and FS_Sampling.json next to the regular outputs
+        with open(self.io_dir + "/FS_SampledPerformanceMetrics.txt", "w") as file:
+            file.write(self.metrics())
+        with open(self.io_dir + "/FS_Sampling.json", "w") as file:
+            json.dump(dict(self.estimate(), samples=self.samples), file, indent=2)
+            file.write("\n")
+
+
+def undefined_as_na(value):
+    return "n/a" if value is None else value
+
+
+def functional_instructions(core: FunctionalCore) -> int:
+    return core.instruction_count - 1 if core.halted else core.instruction_count
@@ -0,0 +1,82 @@
+# default size of the write buffer of every trace file, in bytes
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+
+class TraceWriter(object):
+    # One output file kept open for the whole run and written through a large buffer, instead of
+    # reopening the file in append mode every cycle. The file is created (truncated) on the first
+    # write, like the cycle 0 "w" open it replaces, and flushed to disk on close().
+
+    def __init__(self, path: str, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.stream = None
+        self.mode = "w"  # becomes "a" once the file was created so a reopen after close() appends
+
+    def _open(self):
+        return open(self.path, self.mode, buffering=self.buffer_size)
+
+    def write(self, text: str):
+        if self.stream is None:
+            self.stream = self._open()
+            self.mode = "a"
+        self.stream.write(text)
+
+    def writelines(self, lines):
+        if self.stream is None:
+            self.stream = self._open()
+            self.mode = "a"
+        self.stream.writelines(lines)
+
+    def flush(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class TracePolicy(object):
+    # Selects the cycles dumped to the RF / state traces:
+    #   full    - every cycle (default, the reference output format)
+    #   every-N - every N-th cycle plus the final one
+    #   final   - only the final cycle
+    #   none    - nothing, the trace files are not even created
+    # Cycles that are not dumped skip the RF / State string formatting entirely.
+
+    LEVELS = ("none", "final", "every", "full")
+
+    def __init__(self, level: str = "full", every: int = 1):
+        if level not in self.LEVELS:
+            raise ValueError(f"Invalid trace level: {level}")
+        if every < 1:
+            raise ValueError(f"Invalid trace interval: {every}")
+        self.level = level
+        self.every = every if level == "every" else 1
+
+    @classmethod
+    def parse(cls, spec: str) -> "TracePolicy":
+        # "none", "final", "full" or "every-N"
+        if spec.startswith("every-"):
+            try:
+                return cls("every", int(spec[len("every-"):]))
+            except ValueError:
+                raise ValueError(f"Invalid trace level: {spec}")
+        return cls(spec)
+
+    @property
+    def enabled(self) -> bool:
+        return self.level != "none"
+
+    def wants(self, cycle: int, final: bool) -> bool:
+        # True if the state after executing cycle has to be dumped, final is True on the halting cycle
+        if self.level == "full":
+            return True
+        if self.level == "none":
+            return False
+        return final or (self.level == "every" and cycle % self.every == 0)
+
+    def __str__(self):
+        return f"every-{self.every}" if self.level == "every" else self.level
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Synthetic RV32I workload generator
+Writes imem.txt / dmem.txt of a random program made of the instructions the simulator implements. The program is
+an outer loop of `trips` iterations around an inner loop of `inner` iterations over a random body of `size`
+instructions, so the dynamic instruction count is about trips * inner * size and reaches millions with a small
+imem.txt. The body follows the requested instruction mix, dependency distance, load-use frequency and branch
+taken rate, and its loads / stores walk a data footprint of `footprint` bytes initialised by dmem.txt.
+
+    python workload.py OUT_DIR [--config "size=200,trips=5000,load=25,taken=0.3,footprint=65536,seed=1"]
+
+The footprint is rounded down to a multiple of the 2 KiB window the 12-bit load / store offsets reach.
+"""
+
+import argparse
+import random
+import sys
+
+from program_builder import ProgramBuilder
+
+# Register use of the generated programs
+OUTER_COUNTER = 1  # outer loop trips left
+INNER_COUNTER = 2  # inner loop trips left
+WINDOW_STEP = 3  # bytes per footprint window
+WINDOWS_LEFT = 29  # footprint windows left before the data pointer wraps
+DATA_POINTER = 30  # base address of the current footprint window
+BODY_REGISTERS = list(range(5, 29))  # destinations / sources of the random body
+
+WINDOW_BYTES = 2048  # reach of the 12-bit load / store offsets from the data pointer
+
+
+class WorkloadConfig(object):
+    # parsed from "size=200,trips=1000,alu=55,load=20,store=10,branch=15,dep=3,load_use=0.5,taken=0.5,..."
+    # alu / load / store / branch are relative weights of the body instruction mix
+
+    DEFAULTS = {
+        "size": 200,  # static instructions of the loop body
+        "trips": 1000,  # outer loop trip count
+        "inner": 1,  # inner loop trip count
+        "alu": 55,
+        "load": 20,
+        "store": 10,
+        "branch": 15,
+        "dep": 3.0,  # mean distance (in instructions) between a result and its use
+        "load_use": 0.5,  # probability that the instruction right after a load uses the loaded value
+        "taken": 0.5,  # fraction of the body branches that are taken
+        "footprint": 16384,  # bytes of data memory walked by the loads / stores
+        "seed": 0,
+    }
+
+    def __init__(self, **options):
+        for key, default in self.DEFAULTS.items():
+            setattr(self, key, type(default)(options.pop(key, default)))
+        if options:
+            raise ValueError(f"Invalid workload option: {', '.join(options)}")
+        if self.size < 1 or self.trips < 1 or self.inner < 1:
+            raise ValueError(f"Invalid workload loop: size={self.size} trips={self.trips} inner={self.inner}")
+        if min(self.alu, self.load, self.store, self.branch) < 0 or \
+                self.alu + self.load + self.store + self.branch <= 0:
+            raise ValueError("Invalid workload mix: weights must be >= 0 and not all 0")
+        if self.dep < 1 or not 0 <= self.load_use <= 1 or not 0 <= self.taken <= 1:
+            raise ValueError(f"Invalid workload parameters: dep={self.dep} load_use={self.load_use} taken={self.taken}")
+        if self.footprint < 4 or self.footprint % 4:
+            raise ValueError(f"Invalid workload footprint: {self.footprint} is not a positive multiple of 4")
+        if self.trips >= 1 << 31 or self.inner >= 1 << 31:
+            raise ValueError("Invalid workload loop: trip counts must fit 31 bits")
+
+    @classmethod
+    def parse(cls, spec: str) -> "WorkloadConfig":
+        options = {}
+        for item in filter(None, spec.split(",")):
+            key, sep, value = item.partition("=")
+            key = key.strip()
+            if not sep or key not in cls.DEFAULTS:
+                raise ValueError(f"Invalid workload option: {item}")
+            try:
+                options[key] = float(value) if isinstance(cls.DEFAULTS[key], float) else int(value, 0)
+            except ValueError:
+                raise ValueError(f"Invalid workload option: {item}")
+        return cls(**options)
+
+    def __str__(self):
+        return ",".join(f"{key}={getattr(self, key)}" for key in self.DEFAULTS)
+
+
+class WorkloadGenerator(object):
+    def __init__(self, config: WorkloadConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.window = min(config.footprint, WINDOW_BYTES)
+        self.windows = max(1, config.footprint // self.window)
+        self.written = []  # destination register of every body instruction so far, most recent last
+
+    def source(self) -> int:
+        # register written about config.dep instructions ago (geometric distance), x0 before anything was written
+        distance = 1
+        while self.random.random() > 1 / self.config.dep:
+            distance += 1
+        if distance > len(self.written):
+            return self.random.choice(self.written) if self.written else 0
+        return self.written[-distance]
+
+    def destination(self) -> int:
+        # round robin, so a register is not overwritten before dependency distances of len(BODY_REGISTERS)
+        register = BODY_REGISTERS[len(self.written) % len(BODY_REGISTERS)]
+        self.written.append(register)
+        return register
+
+    def offset(self) -> int:
+        return self.random.randrange(0, self.window, 4)
+
+    def alu(self, program: ProgramBuilder, rs1: int = None):
+        rs1 = self.source() if rs1 is None else rs1
+        if self.random.random() < 0.5:
+            operation = self.random.choice((program.add, program.sub, program.xor, program.or_, program.and_))
+            operation(self.destination(), rs1, self.source())
+        else:
+            operation = self.random.choice((program.addi, program.xori, program.ori, program.andi))
+            operation(self.destination(), rs1, self.random.randrange(-2048, 2048))
+
+    def body(self, program: ProgramBuilder):
+        config = self.config
+        kinds = self.random.choices(("alu", "load", "store", "branch"),
+                                    (config.alu, config.load, config.store, config.branch), k=config.size)
+        pending = {}  # label of a forward branch -> index of the body instruction it precedes
+        emitted = 0
+
+        def tick():
+            # one more body instruction emitted, place the labels reached
+            nonlocal emitted
+            emitted += 1
+            for label in [label for label in pending if pending[label] == emitted]:
+                program.label(label)
+                del pending[label]
+
+        while emitted < config.size:
+            kind = kinds[emitted]
+            if kind == "load":
+                program.lw(self.destination(), DATA_POINTER, self.offset())
+                tick()
+                if emitted < config.size and self.random.random() < config.load_use:
+                    # the next instruction consumes the load right away
+                    self.alu(program, self.written[-1])
+                    tick()
+            elif kind == "store":
+                program.sw(self.source(), DATA_POINTER, self.offset())
+                tick()
+            elif kind == "branch" and emitted + 1 < config.size:
+                # forward branch over 1-3 instructions, outcome fixed per site: beq rX, rX is always taken,
+                # bne rX, rX never, so config.taken is the fraction of taken branch sites
+                label = f"skip{emitted}"
+                register = self.source()
+                if self.random.random() < config.taken:
+                    program.beq(register, register, label)
+                else:
+                    program.bne(register, register, label)
+                pending[label] = min(emitted + 1 + self.random.randint(1, 3), config.size)
+                tick()
+            else:
+                self.alu(program)
+                tick()
+        for label in pending:
+            program.label(label)
+
+    @staticmethod
+    def loop_back(program: ProgramBuilder, counter: int, label: str):
+        # branch back to label while counter != 0 - through a JAL when the body is beyond the BNE reach of 4 KiB
+        if program.pc - program.labels[label] < 4096:
+            program.bne(counter, 0, label)
+        else:
+            done = f"{label}_done"
+            program.beq(counter, 0, done)
+            program.jal(0, label)
+            program.label(done)
+
+    def build(self) -> ProgramBuilder:
+        config = self.config
+        program = ProgramBuilder()
+        data = [self.random.getrandbits(32) for _ in range(self.windows * self.window // 4)]
+        program.data_words(data)
+
+        program.load_constant(OUTER_COUNTER, config.trips)
+        program.load_constant(WINDOWS_LEFT, self.windows)
+        program.load_constant(WINDOW_STEP, self.window)
+        program.addi(DATA_POINTER, 0, 0)
+        program.label("outer")
+        program.load_constant(INNER_COUNTER, config.inner)
+        program.label("inner")
+        self.body(program)
+        program.addi(INNER_COUNTER, INNER_COUNTER, -1)
+        self.loop_back(program, INNER_COUNTER, "inner")
+        # next footprint window, back to the first one after the last
+        program.addi(WINDOWS_LEFT, WINDOWS_LEFT, -1)
+        program.bne(WINDOWS_LEFT, 0, "advance")
+        program.load_constant(WINDOWS_LEFT, self.windows)
+        program.addi(DATA_POINTER, 0, 0)
+        program.jal(0, "next")
+        program.label("advance")
+        program.add(DATA_POINTER, DATA_POINTER, WINDOW_STEP)
+        program.label("next")
+        program.addi(OUTER_COUNTER, OUTER_COUNTER, -1)
+        self.loop_back(program, OUTER_COUNTER, "outer")
+        program.halt()
+        return program
+
+
+def generate(config: WorkloadConfig) -> ProgramBuilder:
+    return WorkloadGenerator(config).build()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic RV32I workload generator')
+    parser.add_argument("out_dir", type=str, help="Directory imem.txt and dmem.txt are written to.")
+    parser.add_argument("--config", default="", type=str,
+                        help="Comma separated key=value workload parameters: " + ", ".join(WorkloadConfig.DEFAULTS) + ".")
+    args = parser.parse_args()
+
+    try:
+        config = WorkloadConfig.parse(args.config)
+    except ValueError as error:
+        parser.error(str(error))
+    program = generate(config)
+    program.write(args.out_dir)
+    print(f"{len(program.words)} instructions, {len(program.data) * 4} data bytes written to {args.out_dir} ({config})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())